@@ -42,9 +42,8 @@ try:
 except ImportError:
     import Queue as queue  # python 2.x
 
-import feedparser
-
 from podfetch.fsstorage import FileSystemStorage
+from podfetch.model import DOWNLOAD_THREADS
 from podfetch.model import Subscription
 from podfetch.predicate import Filter
 from podfetch.predicate import PubdateAfter
@@ -92,11 +91,14 @@ class Podfetch:
         if no specific template is defined on the subscription level.
     :var int update_threads:
         The number of update threads to use.
+    :var int download_threads:
+        The number of episodes to download in parallel
+        for each subscription.
     '''
 
     def __init__(self, config_dir, index_dir, content_dir, cache_dir,
         filename_template=None, update_threads=1, ignore=None,
-        supported_content=None):
+        supported_content=None, download_threads=DOWNLOAD_THREADS):
         self.config_dir = config_dir
         self.subscriptions_dir = os.path.join(config_dir, 'subscriptions')
         self.index_dir = index_dir
@@ -104,8 +106,12 @@ class Podfetch:
         self.cache_dir = cache_dir
         self.filename_template = filename_template
         self.update_threads = max(1, update_threads)
+        self.download_threads = max(1, download_threads)
         self.ignore = ignore
-        self.supported_content = supported_content or {}
+        # content types are compared in lowercase
+        self.supported_content = {
+            k.lower(): v for k, v in (supported_content or {}).items()
+        }
 
         self._storage = FileSystemStorage(
             self.subscriptions_dir,
@@ -121,6 +127,7 @@ class Podfetch:
         LOG.debug('cache_dir: %r.', self.cache_dir)
         LOG.debug('filename_template: %r.', self.filename_template)
         LOG.debug('update_threads: %s', self.update_threads)
+        LOG.debug('download_threads: %s', self.download_threads)
         LOG.debug('ignore: %r', self.ignore)
         LOG.debug('supported_content: %s', ', '.join(self.supported_content.keys()))
 
@@ -139,6 +146,7 @@ class Podfetch:
             name,
             app_filename_template=self.filename_template,
             supported_content=self.supported_content,
+            download_threads=self.download_threads,
         )
 
     def iter_subscriptions(self, predicate=None):
@@ -153,12 +161,19 @@ class Podfetch:
         for s in self._storage.iter_subscriptions(predicate=predicate):
             s.supported_content = self.supported_content
             s.app_filename_template = self.filename_template
+            s.download_threads = self.download_threads
             yield s
 
     def iter_episodes(self, sub_filter=None):
         '''Iterate over Episodes from all subscriptions.'''
         for subscription in self.iter_subscriptions(predicate=sub_filter):
-            for episode in subscription.episodes:
+            try:
+                episodes = subscription.episodes
+            except ex.StorageError as err:
+                LOG.error(err)
+                LOG.debug(err, exc_info=True)
+                continue
+            for episode in episodes:
                 yield episode
 
     def list_episodes(self, *sub_names, since=None, until=None, limit=None):
@@ -205,7 +220,7 @@ class Podfetch:
         :param bool force:
             *optional*,
             force update, ignore HTTP etag and not modified in feed.
-            Re-download all episodes.
+            Request all episodes again; unmodified episodes are kept.
             Also update *disabled* subscriptions.
             Default is *False*.
         :param Filter predicate:
@@ -231,24 +246,35 @@ class Podfetch:
 
         def update_one(subscription, force=False):
             LOG.info('Update %r.', subscription.name)
-            initial_episode_count = len(subscription.episodes)
             try:
-                subscription.update(self._storage, force=force)
-                self._storage.save_subscription(subscription)
-            except Exception as err:
-                LOG.error('Failed to fetch feed %r. Error was: %s',
-                    subscription.name, err)
-                LOG.debug(err, exc_info=True)
+                try:
+                    initial_episode_count = len(subscription.episodes)
+                except ex.StorageError as err:
+                    LOG.error(err)
+                    LOG.debug(err, exc_info=True)
+                    return
+
+                try:
+                    try:
+                        subscription.update(self._storage, force=force)
+                    finally:
+                        # keep a new feed_url (HTTP 301),
+                        # even if processing the entries failed
+                        self._storage.save_subscription(subscription)
+                except Exception as err:
+                    LOG.error('Failed to fetch feed %r. Error was: %s',
+                        subscription.name, err)
+                    LOG.debug(err, exc_info=True)
+
+                if initial_episode_count < len(subscription.episodes):
+                    self.run_hooks(
+                        SUBSCRIPTION_UPDATED,
+                        subscription.name,
+                        subscription.content_dir
+                    )
             finally:
                 tasks.task_done()
 
-            if initial_episode_count < len(subscription.episodes):
-                self.run_hooks(
-                    SUBSCRIPTION_UPDATED,
-                    subscription.name,
-                    subscription.content_dir
-                )
-
         num_workers = self.update_threads
         use_threading = num_tasks > 1 and num_workers > 1
 
@@ -301,6 +327,7 @@ class Podfetch:
             filename_template=filename_template,
             app_filename_template=self.filename_template,
             supported_content=self.supported_content,
+            download_threads=self.download_threads,
         )
         self._storage.save_subscription(sub)
         self.run_hooks(SUBSCRIPTION_ADDED, sub.name, sub.content_dir)
@@ -4,9 +4,19 @@ File system storage.
 
 
 '''
+import functools
 import json
 import logging
 import os
+import re
+import shutil
+import stat
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 try:
     from configparser import ConfigParser  # python 3.x
@@ -31,6 +41,18 @@ LOG = logging.getLogger(__name__)
 # section in subscription ini's
 SECTION = 'subscription'
 
+# the episode journal is merged into the index
+# when it grows beyond this size (or the size of the index)
+JOURNAL_MIN_SIZE = 64 * 1024
+
+_INI_DELIMITER = re.compile(r'[=:]')
+
+# name of the file in *cache_dir* which holds all cache entries
+_CACHE_FILE = 'cache.json'
+
+# keys that were stored as separate ``{namespace}.{key}`` cache files
+_LEGACY_CACHE_KEYS = ('etag', 'modified')
+
 
 class FileSystemStorage(Storage):
 
@@ -46,6 +68,11 @@ class FileSystemStorage(Storage):
         self.default_content_dir = default_content_dir
         self.cache_dir = cache_dir
         self.ignore = ignore
+        self._cache = None
+        # (mtime_ns, size) of the cache file when it was last read/written
+        self._cache_version = None
+        self._cache_checked = set()
+        self._cache_lock = threading.RLock()
 
     # Subscriptons ------------------------------------------------------------
 
@@ -55,28 +82,42 @@ class FileSystemStorage(Storage):
     def _index_path(self, name):
         return os.path.join(self.index_dir, '{}.json'.format(name))
 
+    def _journal_path(self, name):
+        return os.path.join(self.index_dir, '{}.journal'.format(name))
+
     def save_subscription(self, subscription):
         '''Save a single subscription.'''
         s = subscription
-        cfg = _mk_config_parser()
-        cfg.add_section(SECTION)
-
-        def _set(key, value):
-            if value:  # will lose max_episodes = 0
-                cfg.set(SECTION, key, value)
-
-        _set('url', s.feed_url)
-        _set('max_episodes', str(s.max_episodes))
-        _set('enabled', 'yes' if s.enabled else 'no')
-        _set('title', s.title)
-        _set('filename_template', s.filename_template)
-        _set('content_dir', s._content_dir)
+        values = (
+            ('url', s.feed_url),
+            ('max_episodes', str(s.max_episodes)),
+            ('enabled', 'yes' if s.enabled else 'no'),
+            ('title', s.title),
+            ('filename_template', s.filename_template),
+            ('content_dir', s._content_dir),
+        )
+        # same output as ConfigParser.write()
+        # multi-line values are written as indented continuation lines
+        lines = ['[{}]'.format(SECTION)]
+        lines.extend(
+            '{} = {}'.format(key, str(value).replace('\n', '\n\t'))
+            for key, value in values
+            if value  # will lose max_episodes = 0
+        )
+        text = '\n'.join(lines) + '\n\n'
 
         path = self._subscription_path(s.name)
+        try:
+            with open(path) as fp:
+                if fp.read() == text:
+                    LOG.debug('Subscription %r is unchanged.', s.name)
+                    return
+        except FileNotFoundError:
+            pass
+
         LOG.debug('Save Subscription %r to %r.', s.name, path)
-        require_directory(os.path.dirname(path))
-        with open(path, 'w') as fp:
-            cfg.write(fp)
+        # never leave a truncated subscription file behind
+        _write_atomic(path, text)
 
     def iter_subscriptions(self, predicate=None):
         '''Iterate over all subscriptions matching the given ``predicate``.'''
@@ -85,11 +126,19 @@ class FileSystemStorage(Storage):
         if self.ignore:
             predicate = predicate.and_not(WildcardFilter(*self.ignore))
 
-        for basedir, dirnames, filenames in os.walk(self.config_dir):
-            for name in filenames:
-                if predicate(name):
+        try:
+            entries = os.scandir(self.config_dir)
+        except FileNotFoundError:
+            return
+
+        # scandir gives us the stat result for the config cache key
+        # without another system call per file
+        with entries:
+            for entry in entries:
+                if entry.is_file() and predicate(entry.name):
                     try:
-                        yield self.load_subscription(name)
+                        yield self._load_subscription(entry.name, entry.path,
+                                                      entry.stat())
                     except Exception as err:  # TODO exception type
                         LOG.error(err)
                         LOG.debug(err, exc_info=True)
@@ -97,54 +146,34 @@ class FileSystemStorage(Storage):
     def load_subscription(self, name, **kwargs):
         '''Load a single subscription by name.'''
         path = self._subscription_path(name)
-
-        cfg = _mk_config_parser()
-        # possible errors:
-        # file does not exist
-        # file is no in ini format
-        # missing sections and options
         try:
-            read_from = cfg.read(path)
-        except _ConfigParserError:
-            raise NoSubscriptionError(('Failed to read subscription from'
-                                       ' {!r}.').format(path))
-        if not read_from:
+            st = os.stat(path)
+        except OSError:
             raise NoSubscriptionError(('No config file exists at'
                                        ' {!r}.').format(path))
 
-        LOG.debug('Read subscription from %r.', path)
+        return self._load_subscription(name, path, st, **kwargs)
 
-        def get(key, default=None, fmt=None):
-            result = default
-            try:
-                if fmt == 'int':
-                    result = cfg.getint(SECTION, key)
-                elif fmt == 'bool':
-                    result = cfg.getboolean(SECTION, key)
-                else:
-                    result = cfg.get(SECTION, key)
-            except _ConfigParserError:
-                LOG.debug('Could not read %r from ini.', key)
-            return result
-
-        feed_url = get('url')
-        if not feed_url:
+    def _load_subscription(self, name, path, st, **kwargs):
+        values = _read_subscription_config(path, st.st_mtime_ns, st.st_size)
+        if not values.get('url'):
             raise NoSubscriptionError(('Failed to read URL from'
                                        ' {p!r}.').format(p=path))
 
         sub = Subscription(
             name,
-            feed_url,
+            values['url'],
             self.default_content_dir,
-            title=get('title'),
-            max_episodes=get('max_episodes', default=-1, fmt='int'),
-            enabled=get('enabled', default=True, fmt='bool'),
-            content_dir=get('content_dir'),
-            filename_template=get('filename_template'),
+            title=values['title'],
+            max_episodes=values['max_episodes'],
+            enabled=values['enabled'],
+            content_dir=values['content_dir'],
+            filename_template=values['filename_template'],
             **kwargs
         )
 
-        sub.episodes = self._load_episodes(sub) or []
+        # listing subscriptions does not need their episodes
+        sub.load_episodes_with(functools.partial(self._load_episodes, sub))
 
         return sub
 
@@ -158,6 +187,7 @@ class FileSystemStorage(Storage):
             pass
 
         delete_if_exists(self._index_path(name))
+        delete_if_exists(self._journal_path(name))
 
         self.cache_forget(name)
 
@@ -174,6 +204,8 @@ class FileSystemStorage(Storage):
 
         LOG.info('Move %r to %r', src_path, dst_path)
         shutil.move(src_path, dst_path)
+        # fold pending journal entries into the index before moving it
+        self._compact_index(oldname)
         LOG.debug('Move %r to %r', src_index, dst_index)
         shutil.move(src_index, dst_index)
 
@@ -182,62 +214,129 @@ class FileSystemStorage(Storage):
     # Episodes ----------------------------------------------------------------
 
     def _load_episodes(self, sub):
-        '''Load all episodes for the given subscription.'''
-        name = sub.name
-        data = self._load_episode_index(name)
+        '''Load all episodes for the given subscription.
 
-        return [
-            Episode.from_dict(sub, sub.supported_content, d)
-            for d in data
-        ]
+        Episodes are loaded on first access, after the subscription was
+        loaded; a broken index raises a :class:`StorageError`
+        for this subscription only.'''
+        name = sub.name
+        try:
+            data = self._load_episode_index(name)
+            return [
+                Episode.from_dict(sub, sub.supported_content, d)
+                for d in data
+            ]
+        except Exception as err:
+            raise StorageError(('Failed to load episodes for {!r}.'
+                                ' Error was: {}').format(name, err)) from err
 
     def _load_episode_index(self, name):
+        '''Read the index for the given subscription,
+        including entries from the journal.'''
         data = []
         try:
-            with open(self._index_path(name)) as src:
-                data = json.load(src)
+            with open(self._index_path(name), 'rb') as src:
+                data = _loads(src.read())
         except FileNotFoundError:
             pass
 
+        journal = self._read_journal(name)
+        if journal:
+            positions = {item['id']: index for index, item in enumerate(data)}
+            for item in journal:
+                index = positions.get(item['id'])
+                if index is None:
+                    positions[item['id']] = len(data)
+                    data.append(item)
+                else:
+                    data[index] = item
+
         return data
 
+    def _read_journal(self, name):
+        try:
+            with open(self._journal_path(name), 'rb') as src:
+                lines = [line for line in src.read().split(b'\n')
+                         if line.strip()]
+        except FileNotFoundError:
+            return []
+
+        # parse all entries in one go, one line at a time only if
+        # that fails because of an incomplete entry
+        try:
+            return _loads(b'[' + b','.join(lines) + b']')
+        except ValueError:
+            pass
+
+        entries = []
+        for line in lines:
+            try:
+                entries.append(_loads(line))
+            except ValueError:
+                # incomplete line from an interrupted write
+                LOG.warning('Skip invalid journal entry for %r.', name)
+
+        return entries
+
+    def _compact_index(self, name):
+        '''Merge the journal into the index file.'''
+        if os.path.exists(self._journal_path(name)):
+            LOG.debug('Compact index %r', name)
+            self._save_index_file(name, self._load_episode_index(name))
+
     def save_episodes(self, name, episodes):
         '''Save all episodes for a subscription.'''
         data = [e.as_dict() for e in episodes]
         self._save_index_file(name, data)
 
     def _save_index_file(self, name, data):
-        LOG.debug('Save index file %r', name)
+        '''Write the complete index for a subscription
+        and discard the journal.'''
         path = self._index_path(name)
-        if data:
-            require_directory(os.path.dirname(path))
-            with open(path, 'w') as dst:
-                json.dump(data, dst)
-        else:
+        if not data:
+            LOG.debug('Delete empty index file %r', name)
             delete_if_exists(path)
+        else:
+            self._write_index_file(name, path, _dumps(data))
+
+        # the index now holds everything from the journal
+        delete_if_exists(self._journal_path(name))
+
+    def _write_index_file(self, name, path, buf):
+        try:
+            with open(path, 'rb') as src:
+                if src.read() == buf:
+                    LOG.debug('Index file %r is unchanged', name)
+                    return
+        except FileNotFoundError:
+            pass
+
+        LOG.debug('Save index file %r', name)
+        _write_atomic(path, buf)
 
     def save_episode(self, episode):
-        '''Save a single episode.'''
+        '''Save a single episode.
+
+        The episode is appended to a journal next to the index file.
+        Once the journal grows larger than the index,
+        both are merged into a new index file.
+        '''
         LOG.debug('Save episode %r', episode)
         name = episode.subscription.name
-        episode_id = episode.id
-        episode_list = self._load_episode_index(name)
-
-        episode_data = episode.as_dict()
+        journal_path = self._journal_path(name)
+        require_directory(os.path.dirname(journal_path))
+        with open(journal_path, 'ab') as dst:
+            # leading newline terminates a line left over from
+            # an interrupted write
+            dst.write(b'\n' + _dumps(episode.as_dict()) + b'\n')
 
-        update_index = None
-        for index, item in enumerate(episode_list):
-            existing_id = item['id']
-            if existing_id == episode_id:
-                update_index = index
-                break
-
-        if update_index is not None:
-            episode_list[update_index] = episode_data
-        else:
-            episode_list.append(episode_data)
+        try:
+            index_size = os.path.getsize(self._index_path(name))
+        except FileNotFoundError:
+            index_size = 0
 
-        self._save_index_file(name, episode_list)
+        if os.path.getsize(journal_path) > max(index_size, JOURNAL_MIN_SIZE):
+            self._compact_index(name)
 
     def delete_episode(self, episode):
         name = episode.subscription.name
@@ -261,64 +360,301 @@ class FileSystemStorage(Storage):
         raise StorageError('Not Implemented')
 
     # Cache -------------------------------------------------------------------
+    # The cache entries for all namespaces are kept in a single JSON document
+    # at ``{cache_dir}/cache.json``, which is kept in memory and read again
+    # only when another process changed it.
+    # Subscriptions are updated in parallel, so access is synchronized.
 
     def cache_get(self, namespace, key):
         '''Get a value from the cache.'''
-        result = None
-        try:
-            with open(self._cache_path(namespace, key)) as cachefile:
-                result = cachefile.read()
-        except FileNotFoundError:
-            pass
-
+        result = self._cache_load(namespace).get(key)
         return result or None  # convert '' to None
 
     def cache_put(self, namespace, key, value):
         '''Put a value into the cache.'''
-        LOG.debug('Cache put %r: %r', key, value)
-        path = self._cache_path(namespace, key)
-        forget = not bool(value)
-        if not forget:
+        self.cache_update(namespace, {key: value})
+
+    def cache_update(self, namespace, values):
+        '''Put several values into the cache with a single write.
+        Keys with an empty value are removed from the cache.'''
+        LOG.debug('Cache put %r: %r', namespace, values)
+        with self._cache_lock:
+            entries = dict(self._cache_load(namespace))
+            for key, value in values.items():
+                if value:
+                    entries[key] = value
+                else:
+                    entries.pop(key, None)
+
             try:
-                require_directory(os.path.dirname(path))
-                with open(path, 'w') as cachefile:
-                    cachefile.write(value)
+                self._cache_save(namespace, entries)
             except Exception as err:
                 LOG.error('Error writing cache file: %r', err)
-                forget = True
-
-        # value was empty or writing failed
-        if forget:
-            self.cache_forget(namespace, key)
 
     def cache_forget(self, namespace, keys=None):
         '''Remove entries for the given cache keys.'''
-        if keys is None:
-            keys = [k for k in self._cache_iter(namespace)]
-
-        for key in keys:
+        with self._cache_lock:
+            if keys is None:
+                entries = {}
+                # or they would be migrated into a namespace of the same name
+                for path, unused in self._legacy_cache_paths(namespace):
+                    delete_if_exists(path)
+            else:
+                entries = dict(self._cache_load(namespace))
+                for key in keys:
+                    entries.pop(key, None)
             try:
-                delete_if_exists(self._cache_path(namespace, key))
+                self._cache_save(namespace, entries)
             except Exception:
-                LOG.error('Failed to delete cache %r of %r.', key, self.name)
+                LOG.error('Failed to delete cache %r of %r.', keys, namespace)
 
-    def _cache_path(self, namespace, key):
-        return os.path.join(self.cache_dir, '{}.{}'.format(namespace, key))
+    def _cache_path(self):
+        return os.path.join(self.cache_dir, _CACHE_FILE)
 
-    def _cache_iter(self, namespace):
-        predicate = namespace + '.'
-        for name in os.listdir(path=self.cache_dir):
-            if name.startswith(predicate):
-                if os.isfile(os.path.join(self.cache_dir, name)):
-                    yield name[len(predicate):]
+    def _cache_all(self):
+        '''The cache entries for all namespaces.
+
+        The cache file is read again if another process
+        changed it since it was last read or written.'''
+        path = self._cache_path()
+        version = _file_version(path)
+        if self._cache is None or version != self._cache_version:
+            self._cache_version = version
+            try:
+                with open(path, 'rb') as src:
+                    self._cache = _loads(src.read())
+            except FileNotFoundError:
+                self._cache = {}
+            except ValueError as err:
+                LOG.error('Invalid cache file %r: %r', path, err)
+                self._cache = {}
+        return self._cache
+
+    def _cache_load(self, namespace):
+        with self._cache_lock:
+            cache = self._cache_all()
+            try:
+                return cache[namespace]
+            except KeyError:
+                pass
+
+            entries = {}
+            if namespace not in self._cache_checked:
+                self._cache_checked.add(namespace)
+                entries = self._cache_migrate(namespace)
+            return entries
+
+    def _cache_save(self, namespace, entries):
+        with self._cache_lock:
+            cache = self._cache_all()
+            if cache.get(namespace, {}) == entries:
+                return
+            cache = dict(cache)
+            if entries:
+                cache[namespace] = entries
+            else:
+                cache.pop(namespace, None)
+
+            path = self._cache_path()
+            if cache:
+                _write_atomic(path, _dumps(cache))
+            else:
+                delete_if_exists(path)
+            self._cache = cache
+            self._cache_version = _file_version(path)
+
+    def _cache_migrate(self, namespace):
+        '''Read cache entries from the old ``{namespace}.{key}`` files
+        into the shared document and remove the old files.'''
+        entries = {}
+        old_files = []
+        for path, key in self._legacy_cache_paths(namespace):
+            try:
+                with open(path) as cachefile:
+                    entries.setdefault(key, cachefile.read())
+                old_files.append(path)
+            except FileNotFoundError:
+                pass
+
+        if old_files:
+            LOG.info('Migrate cache files for %r.', namespace)
+            self._cache_save(namespace, entries)
+            for path in old_files:
+                delete_if_exists(path)
+
+        return entries
+
+    def _legacy_cache_paths(self, namespace):
+        '''``(path, key)`` of the old ``{namespace}.{key}`` cache files.'''
+        for key in _LEGACY_CACHE_KEYS:
+            path = os.path.join(self.cache_dir, '{}.{}'.format(namespace, key))
+            yield path, key
 
     def _cache_rename(self, old_namespace, new_namespace):
-        keys = [k for k in self._cache_iter(old_namespace)]
-        for key in keys:
-            src = self._cache_path(old_namespace, key)
-            dst = self._cache_path(new_namespace, key)
-            LOG.debug('Move %r to %r', src, dst)
-            shutil.move(src, dst)
+        with self._cache_lock:
+            entries = self._cache_load(old_namespace)
+            self.cache_forget(old_namespace)
+            self._cache_save(new_namespace, entries)
+
+
+@functools.lru_cache(maxsize=1024)
+def _read_subscription_config(path, mtime_ns, size):
+    '''Parse the subscription config file at ``path``.
+
+    Results are cached; ``mtime_ns`` and ``size`` are part of the
+    cache key so that a modified file is parsed again.
+
+    :rtype:
+        A dict with the values from the config file.
+    '''
+    try:
+        with open(path) as src:
+            text = src.read()
+    except (FileNotFoundError, IsADirectoryError):
+        raise NoSubscriptionError(('No config file exists at'
+                                   ' {!r}.').format(path))
+
+    # possible errors:
+    # file is no in ini format
+    # missing sections and options
+    options = _parse_subscription_ini(text)
+    if options is None:
+        # not the simple format we write ourselves
+        cfg = _mk_config_parser()
+        try:
+            cfg.read_string(text, source=path)
+            options = dict(cfg.items(SECTION))
+        except (_ConfigParserError, ValueError):
+            raise NoSubscriptionError(('Failed to read subscription from'
+                                       ' {!r}.').format(path))
+
+    LOG.debug('Read subscription from %r.', path)
+
+    def get(key, default=None, fmt=None):
+        result = options.get(key)
+        if result is None:
+            LOG.debug('Could not read %r from ini.', key)
+            return default
+        elif fmt == 'int':
+            return int(result)
+        elif fmt == 'bool':
+            try:
+                return _mk_config_parser().BOOLEAN_STATES[result.lower()]
+            except KeyError:
+                raise ValueError('Not a boolean: {}'.format(result))
+        return result
+
+    return {
+        'url': get('url'),
+        'title': get('title'),
+        'max_episodes': get('max_episodes', default=-1, fmt='int'),
+        'enabled': get('enabled', default=True, fmt='bool'),
+        'content_dir': get('content_dir'),
+        'filename_template': get('filename_template'),
+    }
+
+
+def _parse_subscription_ini(text):
+    '''Read the options from the ``[subscription]`` section of
+    a simple ini file, as written by ``save_subscription()``.
+
+    Only ``key = value`` lines, comments and section headers are
+    understood. For anything else (e.g. multi-line values or
+    duplicate keys) *None* is returned and the caller should
+    use a ``ConfigParser`` instead.
+
+    :rtype dict:
+        Options from the subscription section
+        with lowercase keys or *None*.
+    '''
+    options = {}
+    section = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped[0] in '#;':
+            continue
+        elif line[0].isspace():
+            return None  # continuation line
+        elif stripped[0] == '[':
+            if stripped[-1] != ']':
+                return None
+            section = stripped[1:-1]
+            if section == 'DEFAULT':
+                return None
+            continue
+
+        match = _INI_DELIMITER.search(stripped)
+        if not match or section is None:
+            return None
+        if section == SECTION:
+            key = stripped[:match.start()].strip().lower()
+            value = stripped[match.end():]
+            if key in options:
+                return None
+            options[key] = value.strip()
+
+    return options
+
+
+def _file_version(path):
+    '''``(mtime_ns, size)`` of the file at ``path``
+    or *None* if it does not exist.'''
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _write_atomic(path, buf):
+    '''Write ``buf`` to a temporary file next to ``path``
+    and rename it to ``path``.
+
+    ``buf`` is either ``bytes`` or a ``str``
+    which is written in text mode.
+
+    The file keeps the permissions of the file it replaces;
+    a new file gets the default permissions (respecting the umask).'''
+    dirname = os.path.dirname(path)
+    require_directory(dirname)
+    try:
+        perms = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        perms = None
+    # unlike mkstemp(), let the umask apply as it would for open()
+    while True:
+        tmp_path = os.path.join(dirname, '.{}.{}.tmp'.format(
+            os.path.basename(path), os.urandom(4).hex()))
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o666)
+            break
+        except FileExistsError:
+            continue
+    mode = 'w' if isinstance(buf, str) else 'wb'
+    try:
+        with os.fdopen(fd, mode) as dst:
+            dst.write(buf)
+        if perms is not None:
+            os.chmod(tmp_path, perms)
+        os.replace(tmp_path, path)
+    except Exception:
+        delete_if_exists(tmp_path)
+        raise
+
+
+def _dumps(data):
+    '''Serialize ``data`` to JSON bytes, using *orjson* if available.'''
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
+
+
+def _loads(buf):
+    '''Deserialize JSON from ``buf``, using *orjson* if available.'''
+    if orjson is not None:
+        return orjson.loads(buf)
+    return json.loads(buf.decode('utf-8'))
 
 
 def _mk_config_parser():
@@ -47,6 +47,13 @@ SYSLOG_FMT = '%(levelname)s [%(name)s]: %(message)s'
 LOGFILE_FMT = '%(asctime)s %(levelname)s [%(name)s]: %(message)s'
 DEFAULT_LOG_LEVEL = 'warning'
 
+_CONSOLE_FORMATTER = logging.Formatter(CONSOLE_FMT)
+_SYSLOG_FORMATTER = logging.Formatter(SYSLOG_FMT)
+_LOGFILE_FORMATTER = logging.Formatter(LOGFILE_FMT)
+
+# handlers installed by ``configure_logging()``
+_HANDLERS = []
+
 CFG_DEFAULT_SECTION = 'podfetch'
 SYSTEM_CONFIG_PATH = '/etc/podfetch.conf'
 DEFAULT_USER_CONFIG_PATH = os.path.expanduser(
@@ -58,6 +65,9 @@ EXIT_ERROR = 1
 
 log = logging.getLogger(PROG_NAME)
 
+# the ArgumentParser is built once and reused, see ``_get_parser()``
+_PARSER = None
+
 
 def main(argv=None):
     '''Main entry point as defined in setup.py.
@@ -76,7 +86,7 @@ def main(argv=None):
         Returns an exit code (0=Success, 1=Error).
     '''
     options = read_config()
-    parser = setup_argparser()
+    parser = _get_parser()
     argv = argv or sys.argv[1:]
     parser.parse_args(args=argv, namespace=options)
     configure_logging(options)
@@ -135,6 +145,7 @@ def _create_app(options):
         options.cache_dir,
         filename_template=options.filename_template,
         update_threads=options.update_threads,
+        download_threads=options.download_threads,
         ignore=options.ignore,
         supported_content=options.content_types
     )
@@ -218,6 +229,19 @@ def setup_argparser():
     return parser
 
 
+def _get_parser():
+    '''Get the ``ArgumentParser`` for the command line interface.
+
+    The parser is created on first use and reused for subsequent calls,
+    e.g. if ``main()`` is invoked repeatedly in the same process.
+    Subcommand handlers must not hold per-call state.
+    '''
+    global _PARSER
+    if _PARSER is None:
+        _PARSER = setup_argparser()
+    return _PARSER
+
+
 def _path(argstr):
     path = os.path.expanduser(argstr)
     path = os.path.normpath(path)
@@ -285,7 +309,7 @@ def _update(subs, common):
         '--force',
         action='store_true',
         help=('Force update even if feed is not modified.'
-            ' Re-downloads episodes and overwrites existing files.'),
+            ' Requests episodes again and replaces changed files.'),
     )
 
     def do_update(app, args):
@@ -352,12 +376,13 @@ def _list(subs, common):
     )
 
     def do_ls(app, options):
-        out = sys.stdout
+        # collect output and write it at once
+        lines = []
 
         if not options.path:
             header = 'Podfetch Episodes'
-            out.write('{}\n'.format(header))
-            out.write('{}\n'.format('-' * len(header)))
+            lines.append(header)
+            lines.append('-' * len(header))
 
         if options.since or options.until:
             limit = None
@@ -379,14 +404,13 @@ def _list(subs, common):
             )
             if options.path:
                 for __, __, local in episode.files:
-                    out.write(local)
-                    out.write('\n')
+                    lines.append(local)
             else:
                 if lastdate is None or lastdate != curdate:
-                    out.write('{}:\n'.format(curdate))
+                    lines.append('{}:'.format(curdate))
                     lastdate = curdate
 
-                out.write('\n     '.join(
+                lines.append('\n     '.join(
                     wrap('[{}] {}'.format(
                         episode.subscription.title,
                         episode.title,
@@ -394,7 +418,10 @@ def _list(subs, common):
                     70,
                     initial_indent=' - ',
                 )))
-                out.write('\n')
+
+        if lines:
+            sys.stdout.write('\n'.join(lines))
+            sys.stdout.write('\n')
 
         return EXIT_OK
 
@@ -472,9 +499,7 @@ def _show(subs, common):
             ' if not given, show all'),
     )
 
-    out = sys.stdout
-
-    def render(s):
+    def render(out, s):
         out.write('{:<15}: {}\n'.format('Title', s.title))
         out.write('{:<15}: {}\n'.format('URL', s.feed_url))
         out.write('{:<15}: {}\n'.format('Directory', s.content_dir))
@@ -491,15 +516,16 @@ def _show(subs, common):
         out.write('\n')
 
     def do_show(app, args):
+        out = sys.stdout
         if args.subscription_names:
             for name in args.subscription_names:
                 try:
-                    render(app.subscription_for_name(name))
+                    render(out, app.subscription_for_name(name))
                 except NoSubscriptionError:
                     log.warning('No subscription named {!r}.\n'.format(name))
         else:
             for subscription in app.iter_subscriptions():
-                render(subscription)
+                render(out, subscription)
 
         return EXIT_OK
 
@@ -692,9 +718,7 @@ def _play(subs, common):
         help='Exit immediately, do not wait for the player to finish.'
     )
 
-    out = sys.stdout
-
-    def choose_episode(app, options):
+    def choose_episode(app, options, out):
         limit = options.ls_limit
         names = [options.subscription_name]
         episodes = app.list_episodes(*names, limit=limit)
@@ -713,9 +737,9 @@ def _play(subs, common):
             ))
             out.write('\n')
 
-        return capture_episode(episodes)
+        return capture_episode(episodes, out)
 
-    def capture_episode(episodes):
+    def capture_episode(episodes, out):
         selected = input('Play episode <number>: ')
         if not selected:
             out.write('No episode selected, exit.\n')
@@ -727,10 +751,11 @@ def _play(subs, common):
         except (ValueError, IndexError):
             out.write('Error: Invalid episode number {!r}'.format(selected))
             out.write('\n')
-            return capture_episode(episodes)
+            return capture_episode(episodes, out)
 
     def do_play(app, options):
-        episode = choose_episode(app, options)
+        out = sys.stdout
+        episode = choose_episode(app, options, out)
         if not episode:
             return EXIT_OK
 
@@ -946,6 +971,7 @@ CFG_TYPES = {
         'verbose': _boolean,
         'quiet': _boolean,
         'update_threads': int,
+        'download_threads': int,
         'config_dir': _path,
         'index_dir': _path,
         'content_dir': _path,
@@ -998,7 +1024,7 @@ def read_config():
 
     # system + user config from file(s)
     paths = [SYSTEM_CONFIG_PATH, DEFAULT_USER_CONFIG_PATH,]
-    read_from = cfg.read(paths)
+    read_from = cfg.read(_unique_paths(paths))
 
     def ns(name):
         rv = None
@@ -1031,9 +1057,28 @@ def read_config():
     return root
 
 
-def configure_logging(options):
+def _unique_paths(paths):
+    '''Resolve the given paths and remove duplicates and paths that
+    do not exist, so that each config file is read only once
+    (e.g. if the user config is a symlink to the system config).'''
+    seen = set()
+    result = []
+    for path in paths:
+        real = os.path.realpath(path)
+        if real not in seen and os.path.exists(real):
+            seen.add(real)
+            result.append(real)
+    return result
+
+
+def configure_logging(options, force=False):
     '''Configure log-level and logging handlers.
 
+    Handlers from a previous call are replaced.
+    If the root logger has handlers which were not installed here,
+    e.g. by an application that embeds podfetch,
+    logging is left alone unless ``force`` is *True*.
+
     :param Namespace options:
         a ``Namespace`` instance with the following options:
 
@@ -1054,26 +1099,41 @@ def configure_logging(options):
             Must be one of the constants defined in the ``logging`` module
             (e.g. DEBUG, INFO, ...).
             Has no effect if ``logfile`` is not given.
+    :param bool force:
+        *optional*, configure logging even if other handlers
+        are installed. Defaults to *False*.
     '''
     rootlog = logging.getLogger()
+    if not force and any(h not in _HANDLERS for h in rootlog.handlers):
+        log.debug('Logging is configured elsewhere.')
+        return
+
     rootlog.setLevel(logging.DEBUG)
 
+    # remove handlers from a previous call
+    while _HANDLERS:
+        hdl = _HANDLERS.pop()
+        rootlog.removeHandler(hdl)
+        hdl.close()
+
     if not options.quiet:
         console_hdl = logging.StreamHandler()
         console_level = logging.DEBUG if options.verbose else logging.INFO
         console_hdl.setLevel(console_level)
-        console_hdl.setFormatter(logging.Formatter(CONSOLE_FMT))
+        console_hdl.setFormatter(_CONSOLE_FORMATTER)
         rootlog.addHandler(console_hdl)
+        _HANDLERS.append(console_hdl)
 
     if options.logfile:
         if options.logfile == 'syslog':
             logfile_hdl = handlers.SysLogHandler(address='/dev/log')
-            logfile_hdl.setFormatter(logging.Formatter(SYSLOG_FMT))
+            logfile_hdl.setFormatter(_SYSLOG_FORMATTER)
         else:
             logfile_hdl = handlers.RotatingFileHandler(options.logfile)
-            logfile_hdl.setFormatter(logging.Formatter(LOGFILE_FMT))
+            logfile_hdl.setFormatter(_LOGFILE_FORMATTER)
         logfile_hdl.setLevel(options.log_level)
         rootlog.addHandler(logfile_hdl)
+        _HANDLERS.append(logfile_hdl)
 
 
 if __name__ == '__main__':
@@ -18,20 +18,27 @@ Instances of the ``Subscription`` class are normally created by the
 
 '''
 import errno
-import itertools
+import functools
+import heapq
 import json
 import logging
 import os
 import re
 import shutil
 import stat
+import string
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 from contextlib import closing
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 
-import feedparser
 import requests
+from requests.adapters import HTTPAdapter
 
+from podfetch.__version__ import __version__
 from podfetch.exceptions import FeedGoneError
 from podfetch.exceptions import FeedNotFoundError
 from podfetch.exceptions import NoEpisodeError
@@ -46,6 +53,27 @@ LOG = logging.getLogger(__name__)
 # for generating enclosure-filenames
 DEFAULT_FILENAME_TEMPLATE = '{pub_date}_{id}'
 
+# number of episodes to download in parallel
+DOWNLOAD_THREADS = 4
+
+# held while a feed document is parsed
+_PARSE_LOCK = threading.Lock()
+
+# HTTP settings for downloading enclosures
+DOWNLOAD_TIMEOUT = 30  # seconds
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # bytes
+
+# feeds larger than this are parsed item by item (needs lxml)
+STREAM_PARSE_SIZE = 2 * 1024 * 1024  # bytes
+
+# shared HTTP session,
+# keeps connections alive between downloads from the same host
+_SESSION = requests.Session()
+_SESSION.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
+_SESSION.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
+_SESSION.headers['Accept-Encoding'] = 'gzip, deflate'
+_SESSION.headers['User-Agent'] = 'podfetch/{}'.format(__version__)
+
 # cache keys
 CACHE_ETAG = 'etag'
 CACHE_MODIFIED = 'modified'
@@ -89,8 +117,28 @@ class Subscription:
         Defaults to *True*.
     :var str filename_template:
         Template string used to generate the filenames for downloaded episodes.
+    :var int download_threads:
+        The number of episodes to download in parallel.
+        Defaults to ``DOWNLOAD_THREADS``.
     '''
 
+    __slots__ = (
+        'name',
+        'feed_url',
+        'title',
+        '_default_content_dir',
+        '_content_dir',
+        'max_episodes',
+        'enabled',
+        'filename_template',
+        'app_filename_template',
+        'supported_content',
+        'download_threads',
+        '_episodes',
+        '_episode_loader',
+        '_by_id',
+    )
+
     def __init__(self,
         name,
         feed_url,
@@ -101,7 +149,8 @@ class Subscription:
         enabled=True,
         filename_template=None,
         app_filename_template=None,
-        supported_content=None):
+        supported_content=None,
+        download_threads=DOWNLOAD_THREADS):
 
         self.name = name
         self.feed_url = feed_url
@@ -113,8 +162,43 @@ class Subscription:
         self.filename_template = filename_template
         self.app_filename_template = app_filename_template
         self.supported_content = supported_content or {}
+        self.download_threads = download_threads
+        self._episode_loader = None
         self.episodes = []
 
+    @property
+    def episodes(self):
+        '''The list of :class:`Episode` instances for this subscription.'''
+        self._ensure_episodes()
+        return self._episodes
+
+    @episodes.setter
+    def episodes(self, episodes):
+        self._episode_loader = None
+        self._episodes = episodes
+        # index by id for lookups with ``episode_for_id()``
+        self._by_id = {}
+        for episode in episodes:
+            self._by_id.setdefault(episode.id, episode)
+
+    def load_episodes_with(self, loader):
+        '''Load the episodes on first access instead of right away.
+
+        :param callable loader:
+            Called without arguments to get the list of episodes
+            the first time they are needed.
+        '''
+        self._episodes = None
+        self._episode_loader = loader
+
+    def _ensure_episodes(self):
+        if self._episodes is None:
+            self.episodes = self._episode_loader() or []
+
+    def _add_episode(self, episode):
+        self.episodes.append(episode)
+        self._by_id.setdefault(episode.id, episode)
+
     @property
     def content_dir(self):
         '''The content directory to which episodes are downloaded.
@@ -156,17 +240,20 @@ class Subscription:
         :param bool force:
             *optional*, if *True*, force downloading the feed even if
             HTTP headers indicate it was not modified.
-            Also, re-download all episodes, even if they already exist.
+            Also, request every episode again, even if it exists;
+            enclosures the server reports as not modified are kept.
             Defaults to *False*.
         :raises:
             In addition to the error code, a :class:`FeedNotFoundError`
             or :class:`FeedGoneError` can be raised.
         '''
-        feed = _fetch_feed(
-            self.feed_url,
-            etag=storage.cache_get(self.name, CACHE_ETAG),
-            modified=storage.cache_get(self.name, CACHE_MODIFIED),
-        )
+        if force:
+            etag, modified = None, None
+        else:
+            etag = storage.cache_get(self.name, CACHE_ETAG)
+            modified = storage.cache_get(self.name, CACHE_MODIFIED)
+
+        feed = _fetch_feed(self.feed_url, etag=etag, modified=modified)
         LOG.debug('Feed status is %s', feed.status)
 
         if feed.status == 304:  # not modified
@@ -179,25 +266,28 @@ class Subscription:
             LOG.info('Received status 301, change url for subscription.')
             self.feed_url = feed.href
 
-        entries_ok = True
-        try:
-            entries_ok = self._update_entries(feed, storage, force=force)
-        except Exception:
-            entries_ok = False
-
-        # store etag, modified after *successful* update
+        # store etag, modified after *successful* update;
+        # on errors, keep the old values so the feed is processed again
+        entries_ok = self._update_entries(feed, storage, force=force)
         if entries_ok:
-            storage.cache_put(self.name, CACHE_ETAG, feed.get('etag'))
-            storage.cache_put(self.name, CACHE_MODIFIED, feed.get('modified'))
+            storage.cache_update(self.name, {
+                CACHE_ETAG: feed.get('etag'),
+                CACHE_MODIFIED: feed.get('modified'),
+            })
 
     def _update_entries(self, feed, storage, force=False):
         '''Download content for all feed entries.
 
+        Episodes are downloaded in parallel
+        using up to ``download_threads`` worker threads.
+
         Returns *True* if all downloads were successful,
         *False* if one or more downloads failed.
         '''
         has_errors = False
-        for entry in feed.get('entries', []):
+        pending = []
+        now = datetime.now(UTC)
+        for entry in self._select_entries(feed, now):
             should_save = False
             id_ = id_for_entry(entry)
             LOG.debug('Check episode id %r.', id_)
@@ -211,40 +301,79 @@ class Subscription:
             else:
                 LOG.debug('Got new episode: %r.', id_)
                 episode = Episode.from_entry(
-                    self, self.supported_content, entry)
+                    self, self.supported_content, entry, now=now)
 
                 if episode.has_attachments:
-                    self.episodes.append(episode)
+                    self._add_episode(episode)
                     should_save = True
                 else:
                     LOG.debug(('%r does not have attachments'
                                ' and is ignored.'), episode)
                     continue
 
-            try:
-                should_save = episode.download(force=force)
-            except Exception as err:
-                has_errors = True
-                LOG.error('Failed to update episode %s. Error was %r',
-                    episode, err)
-
-            if should_save:
+            pending.append((episode, should_save))
+
+        # one directory listing instead of a stat() per local file
+        existing = DirectoryListing()
+        workers = max(1, self.download_threads)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(episode.download, force=force,
+                                existing=existing): (
+                    episode, should_save)
+                for episode, should_save in pending
+            }
+            for future in as_completed(futures):
+                episode, should_save = futures[future]
                 try:
-                    storage.save_episode(episode)
+                    should_save = future.result()
                 except Exception as err:
-                    LOG.error('Failed to save episode %r.', episode)
-                    LOG.debug(err, exc_info=True)
                     has_errors = True
+                    LOG.error('Failed to update episode %s. Error was %r',
+                        episode, err)
+
+                # save this subscription's episodes from its update thread
+                # only; other subscriptions may be saved concurrently,
+                # each has its own index and journal
+                if should_save:
+                    try:
+                        storage.save_episode(episode)
+                    except Exception as err:
+                        LOG.error('Failed to save episode %r.', episode)
+                        LOG.debug(err, exc_info=True)
+                        has_errors = True
 
         return not has_errors
 
+    def _select_entries(self, feed, now):
+        '''Select the feed entries to process in an update.
+
+        If ``max_episodes`` is set, only the newest ``max_episodes``
+        entries are considered; older entries would be purged anyway.
+        Entries are ranked by the ``pubdate`` their episodes would get.
+        Entries without an enclosure of a supported type do not count.
+        '''
+        entries = feed.get('entries', [])
+        if self.max_episodes > 0 and len(entries) > self.max_episodes:
+            entries = sorted(
+                (e for e in entries if self._has_supported_enclosure(e)),
+                key=lambda e: tuple(pubdate_for_entry(e, now)[:6]),
+                reverse=True
+            )[:self.max_episodes]
+        return entries
+
+    def _has_supported_enclosure(self, entry):
+        '''Tell if a feed entry has an enclosure we would download.'''
+        return any((enc.get('type') or '').lower() in self.supported_content
+                   for enc in entry.get('enclosures', []))
+
     def episode_for_id(self, episode_id):
         '''Get an Episode by id.'''
-        for episode in self.episodes:
-            if episode.id == episode_id:
-                return episode
-
-        raise NoEpisodeError('No episode with id %r' % episode_id)
+        self._ensure_episodes()
+        try:
+            return self._by_id[episode_id]
+        except KeyError:
+            raise NoEpisodeError('No episode with id %r' % episode_id)
 
     def purge(self, storage, simulate=False):
         '''Delete old episodes, keep only *max_episodes*.
@@ -257,11 +386,12 @@ class Subscription:
         :rtype list:
             list of absolute paths to be deleted.
         '''
-        # sort by date received - oldest come first
-        # select everything EXCEPT the ones to keep
-        episodes = sorted(self.episodes, key=lambda x: x.pubdate)
+        # select everything EXCEPT the ones to keep, oldest first;
+        # no need to sort all episodes to find the oldest few
         keep = max(self.max_episodes, 0)  # -1 to 0
-        selected = episodes[:-keep]
+        count = len(self.episodes) - keep if keep else 0
+        selected = heapq.nsmallest(count, self.episodes,
+                                   key=lambda x: x.pubdate)
 
         LOG.info('Purge %r, select %s episodes to delete (%s to keep)',
             self, len(selected), keep)
@@ -281,27 +411,17 @@ class Subscription:
     def _remove_empty_directories(self):
         '''Remove directories from this subscription's content dir
         if they are empty.'''
-        # list all empty directories below content_dir
-        empty_dirs = []
-        for base, dirnames, filenames in os.walk(self.content_dir):
-            if not dirnames and not filenames:
-                empty_dirs.append(base)
-
-        # delete each directory
-        # since the parent directory may have become empty,
-        # add it to the list of empty dirs
-        while empty_dirs:
-            path = empty_dirs.pop(0)
-            parent = os.path.dirname(path)
+        # bottom-up, so subdirectories are removed before their parent
+        # is visited and the parent may be empty by then
+        for base, unused_dirs, filenames in os.walk(self.content_dir,
+                                                    topdown=False):
+            if filenames or base == self.content_dir:
+                continue
             try:
-                os.rmdir(path)
-                LOG.info('Deleted directory %s', path)
-                if parent != self.content_dir:
-                    # TODO - does not seem to work
-                    if parent not in empty_dirs:
-                        empty_dirs.append(parent)
+                os.rmdir(base)
+                LOG.info('Deleted directory %s', base)
             except OSError as err:
-                if err.errno == os.errno.ENOTEMPTY:
+                if err.errno in (errno.ENOTEMPTY, errno.EEXIST):
                     pass
                 else:
                     raise
@@ -366,14 +486,16 @@ class Episode(object):
 
         self.title = kwargs.get('title')
         self.description = kwargs.get('description')
-        today = datetime.now(UTC).timetuple()
-        self.pubdate = kwargs.get('pubdate', today)
-        self.files = [(url, content_type, local)
-                      for url, content_type, local
-                      in kwargs.get('files', [])]
+        # only read the clock if no pubdate was given
+        self.pubdate = kwargs.get('pubdate') or datetime.now(UTC).timetuple()
+        # JSON gives us lists, keep (url, content_type, local) tuples
+        self.files = list(map(tuple, kwargs.get('files', ())))
+        # download url => {'etag': ..., 'modified': ...}
+        self.http_cache = dict(kwargs.get('http_cache') or {})
 
     @classmethod
-    def from_entry(cls, parent_subscription, supported_content, entry):
+    def from_entry(cls, parent_subscription, supported_content, entry,
+                   now=None):
         '''Create an episode from the information in a feed entry.
 
         :param Subscription parent_subscription:
@@ -383,33 +505,20 @@ class Episode(object):
             to file extensions (e.g. .ogg).
         :param object entry:
             The feed entry.
+        :param datetime now:
+            *optional*, the current time (UTC),
+            pass it when creating several episodes at once.
         :rtype object:
             an Episode instance.
         '''
         id_ = id_for_entry(entry)
-
-        # if pubdate is in the future, set it to 'now'
-        today = datetime.now(UTC)
-        pubdate = entry.published_parsed
-        if pubdate:
-            fromentry = datetime(pubdate[0],  # year
-                                 pubdate[1],  # month
-                                 pubdate[2],  # day
-                                 pubdate[3],  # hour
-                                 pubdate[4],  # minute
-                                 pubdate[5],  # second
-                                 tzinfo=UTC)
-
-            if fromentry > today:
-                pubdate = today.timetuple()
-        else:
-            pubdate = today.timetuple()
-
+        pubdate = pubdate_for_entry(entry, now or datetime.now(UTC))
         return cls(parent_subscription, id_, supported_content,
                    title=entry.title,
                    description=entry.description,
                    pubdate=pubdate,
-                   files=[(enc.href, enc.type, None)
+                   # content types are compared in lowercase
+                   files=[(enc.href, (enc.get('type') or '').lower(), None)
                           for enc
                           in entry.get('enclosures', [])])
 
@@ -441,9 +550,20 @@ class Episode(object):
                     (source_url, type, local_path),
                     (source_url, type, local_path),
                     ...
-                ]
+                ],
+                'http_cache': {
+                    source_url: {
+                        'etag': etag,
+                        'modified': modified,
+                    },
+                    ...
+                }
             }
 
+        ``http_cache`` holds the HTTP ``ETag`` and ``Last-Modified``
+        headers from the last download of each file
+        and may be omitted.
+
         :param dict data_dict:
             The data to create the Episode from.
         :rtype:
@@ -461,10 +581,8 @@ class Episode(object):
             'title': self.title,
             'description': self.description,
             'pubdate': tuple(self.pubdate),
-            'files': [
-                (url, content_type, local)
-                for url, content_type, local in self.files
-            ],
+            'files': list(self.files),
+            'http_cache': self.http_cache,
         }
 
     def _iter_attachments(self):
@@ -477,63 +595,95 @@ class Episode(object):
 
     @property
     def has_attachments(self):
-        return len([f for f in self._iter_attachments()]) > 0
+        return any(True for __ in self._iter_attachments())
 
-    def download(self, force=False):
+    def download(self, force=False, existing=None):
         '''Download all enclosures for this episode.
         Update the association (download url => local_file) in ``self.files``.
 
         :param bool force:
-            *optional*, if *True*, downloads enclosures even if
-            a local file already exists (overwriting the local file).
+            *optional*, if *True*, request enclosures even if
+            a local file already exists.
+            The local file is overwritten unless the server responds
+            with *304 Not Modified*.
             Defaults to *False*.
+        :param existing:
+            *optional*, a container of existing local files
+            (e.g. a :class:`DirectoryListing`).
+            If not given, each local file is checked on the file system.
         '''
+        have_file = _is_file if existing is None else existing.__contains__
         did_download = False
-        for index, item in enumerate(self._iter_attachments()):
-            url, content_type, local_file = item
-            have = self._is_downloaded(url)
-            if not have or force:
-                local_file = self._download_one(index, url, content_type,
-                                                dst_file=local_file)
+        attachment_index = 0
+        # template values shared by all files of this episode
+        template_values = {}
+        for index, (url, content_type, local_file) in enumerate(self.files):
+            if not self._should_download(content_type):
+                continue
+            if force or not have_file(local_file):
+                local_file = self._download_one(
+                    attachment_index, url, content_type, dst_file=local_file,
+                    template_values=template_values)
                 self.files[index] = (url, content_type, local_file)
                 did_download = True
             else:
                 LOG.debug('Skip %r.', url)
+            attachment_index += 1
 
         return did_download
 
-    def _is_downloaded(self, url):
-        '''Tell if the enclosure for the given URL has been downloaded.
-        Specifically, if the local file associated with the URL exists.'''
-        for existing_url, unused, local_file in self.files:
-            if url == existing_url:
-                return local_file is not None and os.path.isfile(local_file)
-        return False
-
     def _should_download(self, content_type):
-        return content_type in self.supported_content
+        # older index entries may have kept the original case
+        return (content_type or '').lower() in self.supported_content
 
-    def _download_one(self, index, url, content_type, dst_file=None):
+    def _download_one(self, index, url, content_type, dst_file=None,
+                      template_values=None):
         '''Download a single enclosure from the given URL.
         Generates a local filename for the enclosure and stores the downloaded
         data there.
         If dst is given, no filename is generated but dst_path is used.
+        ``template_values`` is passed on to ``_generate_filename``.
         returns the path to the local file.
         '''
+        cache = {}
+        part_file = None
         if dst_file:
             local_file = dst_file
+            # only ask for "not modified" if we still have the file
+            if os.path.isfile(local_file):
+                cache = self.http_cache.get(url, {})
+            else:
+                require_directory(os.path.dirname(local_file))
         else:
-            filename = self._generate_filename(content_type, index)
+            filename = self._generate_filename(content_type, index,
+                                               template_values=template_values)
             local_file = os.path.join(self.subscription.content_dir, filename)
-            local_file = unique_filename(local_file)
+            # episodes are downloaded in parallel;
+            # download to a private file and link it to a free name when done
+            require_directory(os.path.dirname(local_file))
+            fd, part_file = tempfile.mkstemp(
+                dir=os.path.dirname(local_file), prefix='.', suffix='.part')
+            os.close(fd)
 
         LOG.info('Download from %r.', url)
         LOG.info('Local file is %r.', local_file)
-        require_directory(os.path.dirname(local_file))
-        download(url, local_file)
+        try:
+            headers = download(url, part_file or local_file,
+                               etag=cache.get(CACHE_ETAG),
+                               modified=cache.get(CACHE_MODIFIED))
+            if part_file:
+                local_file = unique_filename(local_file, src=part_file)
+        finally:
+            if part_file:
+                delete_if_exists(part_file)
+
+        if headers is None:
+            LOG.info('%r is not modified.', url)
+        else:
+            self.http_cache[url] = headers
         return local_file
 
-    def _generate_filename(self, content_type, index):
+    def _generate_filename(self, content_type, index, template_values=None):
         '''Generate a filename for an enclosure with the given index.
 
         The filename will be generated from ``filename_template`` and passed
@@ -547,6 +697,10 @@ class Episode(object):
             Used to determine the file extension.
         :param int index:
             0-based index for episodes with multiple files
+        :param dict template_values:
+            *optional*, a dict to remember template values in.
+            Pass the same dict when generating filenames
+            for several files of this episode.
         :rtype str:
             returns the generated filename.
         '''
@@ -554,31 +708,30 @@ class Episode(object):
                    or self.subscription.app_filename_template \
                    or DEFAULT_FILENAME_TEMPLATE
 
+        if template_values is None:
+            template_values = {}
         ext = self._file_extension_for_mime(content_type)
-        kind = content_type.split('/')[0]
-        values = {k: pretty(v) for k, v in {
-            'subscription_name': self.subscription.name,
-            'pub_date': '{}-{:0>2d}-{:0>2d}'.format(*self.pubdate[0:3]),
-            'year': '{:0>4d}'.format(self.pubdate[0]),
-            'month': '{:0>2d}'.format(self.pubdate[1]),
-            'day': '{:0>2d}'.format(self.pubdate[2]),
-            'hour': '{:0>2d}'.format(self.pubdate[3]),
-            'minute': '{:0>2d}'.format(self.pubdate[4]),
-            'second': '{:0>2d}'.format(self.pubdate[5]),
-            'title': self.title,
-            'feed_title': self.subscription.title,
-            'id': self.id,
-            'ext': ext,
-            'kind': kind,
-        }.items()}
-        filename = safe_filename(template.format(**values))
+        values = {}
+        for field in _template_fields(template):
+            if field not in _TEMPLATE_FIELDS:
+                continue
+            try:
+                values[field] = template_values[field]
+            except KeyError:
+                value = _TEMPLATE_FIELDS[field](self, content_type, ext)
+                if field not in _NUMERIC_TEMPLATE_FIELDS:
+                    value = pretty(value)
+                values[field] = value
+                if field not in _CONTENT_TEMPLATE_FIELDS:
+                    template_values[field] = value
+        filename = safe_filename(template.format_map(values))
 
         # template may or may not include file-ext
         #  - make sure we append a file-extension
         #  - maybe insert the index between ext and basename
         basename, ext_from_template = os.path.splitext(filename)
-        known_exts = [x for x in self.supported_content.values()]
-        if ext_from_template in known_exts:
+        # splitext() includes the dot, supported_content does not
+        if ext_from_template[1:] in self.supported_content.values():
             filename = basename
 
         # in case we have multiple files for an episode,
@@ -592,9 +745,11 @@ class Episode(object):
     def delete_local_files(self):
         '''Delete the local files for this episode (if they exist).'''
         while self.files:
-            unused, unused_also, local_file = self.files.pop()
+            url, unused, local_file = self.files.pop()
             if local_file:  # filename may be empty or None
                 delete_if_exists(local_file)
+            # without the file, the cache headers are useless
+            self.http_cache.pop(url, None)
 
     def move_local_files(self):
         '''Re-apply the filename template for this Episode's downloaded
@@ -603,10 +758,13 @@ class Episode(object):
         Useful if the filename pattern changes.
         '''
         files = self.files[:]
+        template_values = {}
         for index, details in enumerate(files):
             url, content_type, oldpath = details
-            newpath = os.path.join(self.subscription.content_dir,
-                                   self._generate_filename(content_type, index))
+            newpath = os.path.join(
+                self.subscription.content_dir,
+                self._generate_filename(content_type, index,
+                                        template_values=template_values))
             if not oldpath:
                 LOG.warning('Episode %r has no local file', self)
             elif newpath != oldpath:
@@ -630,45 +788,342 @@ class Episode(object):
             The associated file extension *without* a dot ("."),
             e.g. "mp3".
         '''
-        try:
-            return self.supported_content[content_type.lower()]
-        except (KeyError, AttributeError):
+        ext = self.supported_content.get(content_type)
+        if ext is None and isinstance(content_type, str):
+            # older index entries may have kept the original case
+            ext = self.supported_content.get(content_type.lower())
+        if ext is None:
             supported = ', '.join(self.supported_content.keys())
             message = ('Unsupported content type {c!r}.'
                        ' Supported: {s!r}').format(c=content_type,
                                                    s=supported)
             raise ValueError(message)
+        return ext
 
     def __repr__(self):
         return '<Episode id={s.id!r}>'.format(s=self)
 
 
+@functools.lru_cache(maxsize=None)
+def _feedparser():
+    '''The *feedparser* module, imported on first use.
+
+    *feedparser* is slow to import and only needed for updates.
+    '''
+    import feedparser
+    return feedparser
+
+
 def _fetch_feed(url, etag=None, modified=None):
-    '''Download an parse a RSS feed.'''
-    # see:
-    # https://github.com/kurtmckee/feedparser/issues/30
-    #
+    '''Download and parse a RSS feed.
+
+    If ``etag`` or ``modified`` are given, the feed is requested
+    with a conditional GET. If the server responds with
+    *304 Not Modified*, an empty feed is returned.
+
+    The returned feed has the HTTP ``status``, the (final) ``href``
+    and the ``etag`` and ``modified`` headers from the response.
+    '''
+    headers = _conditional_headers(etag, modified)
+    body = None
+    spool = None
+    with closing(_SESSION.get(url, stream=True, headers=headers,
+                              timeout=DOWNLOAD_TIMEOUT)) as resp:
+        if resp.status_code == 410:  # HTTP Gone
+            raise FeedGoneError(('Request for URL {!r} returned'
+                                 ' HTTP 410.').format(url))
+        elif resp.status_code == 404:  # HTTP Not Found
+            raise FeedNotFoundError(('Request for URL {!r} returned'
+                                     ' HTTP 404.').format(url))
+        elif resp.status_code != 304:  # not modified
+            # TODO AuthenticationFailure
+            resp.raise_for_status()
+            if _should_stream_parse(resp.headers):
+                spool = tempfile.TemporaryFile()
+                for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    spool.write(chunk)
+                spool.seek(0)
+            else:
+                body = resp.content
+
+    if body is None and spool is None:
+        feed = _feedparser().FeedParserDict(entries=[])
+    else:
+        response_headers = {k.lower(): v for k, v in resp.headers.items()}
+        response_headers.setdefault('content-location', resp.url)
+        # feeds are fetched in parallel, but parsed one at a time
+        # to keep the memory used by the parser down
+        with _PARSE_LOCK:
+            if spool is None:
+                feed = _parse_feed(body, response_headers)
+            else:
+                with spool:
+                    feed = _stream_parse(spool)
+                    if feed is None:
+                        spool.seek(0)
+                        feed = _parse_feed(spool.read(), response_headers)
+
+    # status of the first response, e.g. 301 if redirected
+    if resp.history:
+        feed['status'] = resp.history[0].status_code
+    else:
+        feed['status'] = resp.status_code
+    feed['href'] = resp.url
+    feed['etag'] = resp.headers.get('ETag')
+    feed['modified'] = resp.headers.get('Last-Modified')
+    return feed
+
+
+def _parse_feed(data, response_headers):
+    '''Parse the feed document in ``data``.
+
+    Uses *atoma* if it is installed, which is a lot faster
+    than *feedparser*.
+    Falls back to *feedparser* if *atoma* is not available
+    or cannot handle the document.
+
+    :param bytes data:
+        The feed document.
+    :param dict response_headers:
+        HTTP response headers with lowercase names,
+        used by *feedparser* to determine the encoding.
+    :rtype FeedParserDict:
+        The parsed feed, *feedparser* style.
+    '''
+    feedparser = _feedparser()
+
+    try:
+        import atoma
+    except ImportError:
+        atoma = None
+
+    if atoma is not None:
+        for parse, entries in ((atoma.parse_rss_bytes, _rss_entries),
+                               (atoma.parse_atom_bytes, _atom_entries)):
+            try:
+                return feedparser.FeedParserDict(
+                    entries=list(entries(parse(data))))
+            except (atoma.FeedDocumentError, atoma.FeedParseError):
+                continue
+        LOG.debug('atoma could not parse the feed, use feedparser.')
+
+    # episode descriptions are stored but never rendered as HTML,
+    # skip sanitizing and resolving URIs in embedded markup
+    return feedparser.parse(data, response_headers=response_headers,
+                            sanitize_html=False,
+                            resolve_relative_uris=False)
+
+
+def _should_stream_parse(response_headers):
+    '''Tell if a feed should be parsed with :func:`_stream_parse`.
+
+    This is the case for feeds larger than ``STREAM_PARSE_SIZE``,
+    if *lxml* is installed.
+    A response without a *Content-Length* is not streamed.
+    '''
     try:
-        feed = feedparser.parse(url, etag=etag, modified=modified)
-    except TypeError as err:
+        size = int(response_headers.get('Content-Length', 0))
+    except ValueError:
+        return False
+    if size <= STREAM_PARSE_SIZE:
+        return False
+    try:
+        import lxml.etree  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _stream_parse(stream):
+    '''Parse a RSS feed from ``stream`` one ``<item>`` at a time.
+
+    Each ``<item>`` element is discarded after it was converted
+    to a feed entry, so the document tree is never held in memory
+    as a whole.
+
+    :param stream:
+        A binary file-like object with the feed document.
+    :rtype FeedParserDict:
+        The parsed feed, *feedparser* style
+        or *None* if the document is not a well-formed RSS feed.
+    '''
+    from lxml import etree
+
+    entries = []
+    context = etree.iterparse(stream, events=('start', 'end'),
+                              resolve_entities=False, no_network=True)
+    try:
+        for event, elem in context:
+            if event == 'start':
+                if elem.getparent() is None and elem.tag != 'rss':
+                    LOG.debug('Not a RSS feed, cannot stream-parse.')
+                    return None
+                continue
+            if elem.tag != 'item':
+                continue
+
+            entries.append(_rss_item_entry(elem))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    except etree.XMLSyntaxError as err:
+        LOG.debug('Failed to stream-parse feed: %s', err)
+        return None
+
+    return _feedparser().FeedParserDict(entries=entries)
+
+
+def _rss_item_entry(item):
+    '''Convert an *lxml* ``<item>`` element to a feed entry.'''
+    # feedparser strips surrounding whitespace;
+    # guid and title make up the id (see ``id_for_entry()``)
+    return _entry(
+        id_=(item.findtext('guid') or '').strip(),
+        title=(item.findtext('title') or '').strip(),
+        description=(item.findtext('description') or '').strip(),
+        published=_parse_date(item.findtext('pubDate')),
+        enclosures=[(enc.get('url'), enc.get('type'))
+                    for enc in item.findall('enclosure')],
+    )
+
+
+def _parse_date(value):
+    '''Parse a RFC 822 or ISO 8601 date.
+
+    Dates without a timezone are taken as UTC.
+
+    :rtype datetime:
+        The parsed date or *None* if ``value`` is empty or not a date.
+    '''
+    if not value:
+        return None
+    for parse in (parsedate_to_datetime, datetime.fromisoformat):
         try:
-            feedparser.PREFERRED_XML_PARSERS.remove('drv_libxml2')
-        except ValueError:
-            # not in the list
-            raise err
-        else:
-            feed = feedparser.parse(url, etag=etag, modified=modified)
+            parsed = parse(value.strip())
+        except (TypeError, ValueError):
+            continue
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=UTC)
+        return parsed
+    return None
+
+
+def _rss_entries(channel):
+    '''Convert the items of an *atoma* RSS channel to feed entries.'''
+    for item in channel.items:
+        yield _entry(
+            id_=item.guid,
+            title=item.title,
+            description=item.description,
+            published=item.pub_date,
+            enclosures=[(enc.url, enc.type) for enc in item.enclosures],
+        )
 
 
-    if feed.status == 410:  # HTTP Gone
-        raise FeedGoneError(('Request for URL {!r} returned'
-                             ' HTTP 410.').format(url))
-    elif feed.status == 404:  # HTTP Not Found
-        raise FeedNotFoundError(('Request for URL {!r} returned'
-                                 ' HTTP 404.').format(url))
-    # TODO AuthenticationFailure
-    # TODO Connection error, Timeouts
-    return feed
+def _atom_entries(atom_feed):
+    '''Convert the entries of an *atoma* Atom feed to feed entries.'''
+    for item in atom_feed.entries:
+        yield _entry(
+            id_=item.id_,
+            title=item.title.value if item.title else None,
+            description=item.summary.value if item.summary else None,
+            published=item.published or item.updated,
+            enclosures=[(link.href, link.type_) for link in item.links
+                        if link.rel == 'enclosure'],
+        )
+
+
+def _entry(id_, title, description, published, enclosures):
+    '''Create a feed entry with the attributes feedparser would set.'''
+    feedparser_dict = _feedparser().FeedParserDict
+    entry = feedparser_dict(
+        title=title or '',
+        description=description or '',
+        # feedparser gives published dates as UTC struct_time
+        published_parsed=published.utctimetuple() if published else None,
+        # FeedParserDict gives "enclosures" from the links
+        links=[feedparser_dict(rel='enclosure', href=href, type=type_)
+               for href, type_ in enclosures],
+    )
+    if id_:
+        entry['id'] = id_
+    return entry
+
+
+def _conditional_headers(etag=None, modified=None):
+    '''HTTP headers for a conditional GET.'''
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if modified:
+        headers['If-Modified-Since'] = modified
+    return headers
+
+
+# values for placeholders in filename templates,
+# called with (episode, content_type, ext)
+_TEMPLATE_FIELDS = {
+    'subscription_name': lambda e, c, x: e.subscription.name,
+    'pub_date': lambda e, c, x: '{}-{:0>2d}-{:0>2d}'.format(*e.pubdate[0:3]),
+    'year': lambda e, c, x: '{:0>4d}'.format(e.pubdate[0]),
+    'month': lambda e, c, x: '{:0>2d}'.format(e.pubdate[1]),
+    'day': lambda e, c, x: '{:0>2d}'.format(e.pubdate[2]),
+    'hour': lambda e, c, x: '{:0>2d}'.format(e.pubdate[3]),
+    'minute': lambda e, c, x: '{:0>2d}'.format(e.pubdate[4]),
+    'second': lambda e, c, x: '{:0>2d}'.format(e.pubdate[5]),
+    'title': lambda e, c, x: e.title,
+    'feed_title': lambda e, c, x: e.subscription.title,
+    'id': lambda e, c, x: e.id,
+    'ext': lambda e, c, x: x,
+    'kind': lambda e, c, x: c.split('/')[0],
+}
+# template fields which depend on the content type of the file
+_CONTENT_TEMPLATE_FIELDS = frozenset(('ext', 'kind'))
+# template fields made of digits and dashes, nothing for pretty() to do
+_NUMERIC_TEMPLATE_FIELDS = frozenset((
+    'pub_date', 'year', 'month', 'day', 'hour', 'minute', 'second'))
+
+
+@functools.lru_cache(maxsize=64)
+def _template_fields(template):
+    '''Return the names of the placeholders used in a filename template.'''
+    fields = set()
+    for unused, field_name, unused_spec, unused_conv in \
+            string.Formatter().parse(template):
+        if field_name:
+            # "{a.b}" and "{a[0]}" refer to "a"
+            fields.add(re.split(r'[.\[]', field_name, 1)[0])
+    return frozenset(fields)
+
+
+class DirectoryListing(object):
+    '''Tells if a file exists, using one ``os.listdir()``
+    per directory instead of a ``stat()`` per file.
+
+    Directory contents are read on first use and not updated afterwards.
+    '''
+
+    def __init__(self):
+        self._names = {}
+
+    def __contains__(self, path):
+        if not path:
+            return False
+        dirname, basename = os.path.split(path)
+        try:
+            names = self._names[dirname]
+        except KeyError:
+            try:
+                names = frozenset(os.listdir(dirname))
+            except OSError:
+                names = frozenset()
+            self._names[dirname] = names
+        return basename in names
+
+
+def _is_file(path):
+    '''Tell if ``path`` is set and points to an existing file.'''
+    return bool(path) and os.path.isfile(path)
 
 
 def id_for_entry(entry):
@@ -681,8 +1136,77 @@ def id_for_entry(entry):
     if entry_id:
         return entry_id
     else:
-        return '{}.{}'.format(''.join(str(x) for x in entry.published_parsed),
-                              entry.get('title', ''))
+        return '{}{}{}{}{}{}{}{}{}.{}'.format(*entry.published_parsed,
+                                             entry.get('title', ''))
+
+
+def pubdate_for_entry(entry, now):
+    '''Determine the publication date for a feed entry.
+
+    This is the published date of the entry.
+    If that is missing or in the future, use ``now``.
+
+    :param datetime now:
+        The current time (UTC).
+    :rtype tuple:
+        The publication date as a UTC time tuple.
+    '''
+    # feedparser leaves out ``published_parsed`` if there is no date
+    pubdate = entry.get('published_parsed')
+    if not pubdate:
+        return now.timetuple()
+
+    fromentry = datetime(pubdate[0],  # year
+                         pubdate[1],  # month
+                         pubdate[2],  # day
+                         pubdate[3],  # hour
+                         pubdate[4],  # minute
+                         pubdate[5],  # second
+                         tzinfo=UTC)
+    if fromentry > now:
+        return now.timetuple()
+    return pubdate
+
+
+# replacements for ``pretty()``
+_PRETTY_TRANSLATIONS = str.maketrans({
+    ' ': '_',
+    ':': '_',
+    ',': '_',
+    ';': '_',
+    '/': '_',
+    '{': '_',
+    '}': '_',
+    '&': '+',
+    'Ä': 'Ae',
+    'Ö': 'Oe',
+    'Ü': 'Ue',
+    'ä': 'ae',
+    'ö': 'oe',
+    'ü': 'ue',
+    'ß': 'ss',
+    # unwanted ascii chars
+    '*': None,
+    '?': None,
+    '!': None,
+    '"': None,
+    '\'': None,
+    '^': None,
+    '\\': None,
+    '´': None,
+    '`': None,
+    '<': None,
+    '>': None,
+})
+# also delete ascii whitespace and control chars,
+# non-ascii chars are dropped when encoding to ascii
+_PRETTY_TRANSLATIONS.update(
+    (code, None) for code in range(128)
+    if chr(code) not in string.ascii_letters + string.digits
+    + string.punctuation
+    and code not in _PRETTY_TRANSLATIONS
+)
+_PRETTY_SEPARATORS = re.compile(r'([-_.])\1+')
 
 
 def pretty(unpretty):
@@ -703,46 +1227,22 @@ def pretty(unpretty):
     if unpretty is None:
         return None
 
-    result = str(unpretty)
-
-    translations = [
-        (' ', '_'),
-        (':', '_'),
-        (',', '_'),
-        (';', '_'),
-        ('/', '_'),
-        ('{', '_'),
-        ('}', '_'),
-        ('&', '+'),
-        ('Ä', 'Ae'),
-        ('Ö', 'Oe'),
-        ('Ü', 'Ue'),
-        ('ä', 'ae'),
-        ('ö', 'oe'),
-        ('ü', 'ue'),
-        ('ß', 'ss'),
-    ]
-    # unwanted ascii chars
-    deletions = ['*', '?', '!', '"', '\'', '^', '\\', '´', '`', '<', '>']
-
-    for text, replacement in itertools.chain(translations, [(c, '') for c in deletions]):
-        result = result.replace(text, replacement)
+    result = str(unpretty).translate(_PRETTY_TRANSLATIONS)
 
-    # delete non-ascii chars and whitespace
-    import string
-    allowed_chars = string.ascii_letters + string.digits + string.punctuation
-    result = ''.join(c for c in result if c in allowed_chars)
+    # delete non-ascii chars
+    result = result.encode('ascii', 'ignore').decode('ascii')
 
     # replace multiple occurence of separators with one separator
     # "---" becomes "-"
-    separators = ['-', '_', '.']
-    for sep in separators:
-        pattern = '[{}]+'.format(sep)
-        result = re.sub(pattern, sep, result)
+    result = _PRETTY_SEPARATORS.sub(r'\1', result)
 
     return result
 
 
+# replacements for ``safe_filename()``
+_SAFE_FILENAME_TRANSLATIONS = str.maketrans({'\\': '_', ':': '_'})
+
+
 def safe_filename(unsafe):
     '''Convert a string so that it is save for use as a filename.
 
@@ -751,50 +1251,101 @@ def safe_filename(unsafe):
     :rtype str:
         A string safe for use as a filename.
     '''
-    safe = unsafe.replace('\\', '_')
-    safe = safe.replace(':', '_')
-    return safe
+    return unsafe.translate(_SAFE_FILENAME_TRANSLATIONS)
 
 
-def unique_filename(path, suffix=None):
+# errors from os.link() on file systems without hardlinks
+_NO_HARDLINK_ERRNOS = frozenset((
+    errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK))
+
+
+def unique_filename(path, suffix=None, src=None):
     '''Given an absolute path, check if a file with that name exists.
-    If yes, append ``suffix + counter`` to the filename until it is unique.'''
-    candidate = path
-    counter = 0
-    max_recurse = 999
+    If yes, append ``suffix + counter`` to the filename until it is unique.
+
+    If ``src`` is given, that file is hardlinked to the unique name,
+    which fails atomically if another thread or process took the name.
+    On file systems without hardlinks, the name is reserved with
+    ``O_EXCL`` and ``src`` is moved there.
+    The caller removes ``src`` afterwards.'''
+    name, ext = os.path.splitext(path)
     suffix = suffix or '.'
-    while os.path.isfile(candidate):
-        if counter > max_recurse:
-            raise RuntimeError('Max recursion depth reached.')
-        name, ext = os.path.splitext(path)
+    candidate = path
+    hardlinks = True
+    # the plain name plus counters 000 to 999
+    for counter in range(1001):
+        if src:
+            try:
+                if hardlinks:
+                    try:
+                        os.link(src, candidate)
+                        return candidate
+                    except OSError as err:
+                        if err.errno not in _NO_HARDLINK_ERRNOS:
+                            raise
+                        hardlinks = False
+                os.close(os.open(candidate,
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+                try:
+                    os.replace(src, candidate)
+                except Exception:
+                    delete_if_exists(candidate)
+                    raise
+                return candidate
+            except FileExistsError:
+                pass
+        elif not os.path.isfile(candidate):
+            return candidate
         candidate = '{n}{s}{c:0>3d}{e}'.format(n=name, s=suffix, c=counter, e=ext)
-        counter += 1
 
-    return candidate
+    raise RuntimeError('Max recursion depth reached.')
 
 
-def download(download_url, dst_path):
+def download(download_url, dst_path, etag=None, modified=None):
     '''Download whatever is located at ``download_url``
     and store it at ``dst_path``.
 
+    Data is written to a temporary file in the destination directory
+    which is then renamed to ``dst_path``.
+
     :param str dst_path:
         Absolute path to the download destination.
         The parent directory of the destination file
         *must* exist.
+    :param str etag:
+        *optional*, ``ETag`` from a previous download of the same URL.
+    :param str modified:
+        *optional*, ``Last-Modified`` from a previous download.
+    :rtype dict:
+        The ``etag`` and ``modified`` headers from the response
+        or *None* if the server responded with *304 Not Modified*,
+        in which case ``dst_path`` is left untouched.
     '''
-    with closing(requests.get(download_url, stream=True)) as r:
+    headers = _conditional_headers(etag, modified)
+    with closing(_SESSION.get(download_url, stream=True, headers=headers,
+                              timeout=DOWNLOAD_TIMEOUT)) as r:
+        if r.status_code == 304:
+            return None
+
         r.raise_for_status()
-        unused, tempdst = tempfile.mkstemp()
-        with open(tempdst, 'wb') as f:
-            chunk_size = 1024
-            for chunk in r.iter_content(chunk_size):
-                f.write(chunk)
+        fd, tempdst = tempfile.mkstemp(dir=os.path.dirname(dst_path),
+                                       prefix='.', suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+
+            LOG.debug('Downloaded to tempdst: %r.', tempdst)
+            # desired permissions are -rw-r--r
+            perms = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH
+            os.chmod(tempdst, perms)
+            # same directory, so this is a rename
+            os.replace(tempdst, dst_path)
+        except Exception:
+            delete_if_exists(tempdst)
+            raise
 
-    LOG.debug('Downloaded to tempdst: %r.', tempdst)
-    try:
-        shutil.move(tempdst, dst_path)
-        # desired permissions are -rw-r--r
-        perms = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH
-        os.chmod(dst_path, perms)
-    finally:
-        delete_if_exists(tempdst)
+        return {
+            CACHE_ETAG: r.headers.get('ETag'),
+            CACHE_MODIFIED: r.headers.get('Last-Modified'),
+        }
@@ -69,5 +69,10 @@ class Storage:
     def cache_put(self, namespace, key, value):
         raise StorageError('Not Implemented')
 
+    def cache_update(self, namespace, values):
+        '''Put several values into the cache at once.'''
+        for key, value in values.items():
+            self.cache_put(namespace, key, value)
+
     def cache_forget(self, namespace, keys=None):
         raise StorageError('Not Implemented')
@@ -10,10 +10,7 @@ LOG = logging.getLogger(__name__)
 
 def require_directory(dirname):
     '''Create the given directory if it does not exist.'''
-    try:
-        os.makedirs(dirname)
-    except FileExistsError:
-        pass
+    os.makedirs(dirname, exist_ok=True)
 
 
 def delete_if_exists(filename):
@@ -46,6 +46,7 @@ setup(
     tests_require=['pytest', 'mock', 'pytest-cov'],
     extras_require={
         'testing': ['pytest', 'mock'],
+        'fast': ['orjson', 'atoma', 'lxml'],
     },
     license="BSD",
     zip_safe=True,
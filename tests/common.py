@@ -104,3 +104,22 @@ FEED_NO_IDS = '''<?xml version="1.0" encoding="UTF-8"?>
   </channel>
 </rss>
 '''
+
+# Atom feed with one enclosure
+FEED_ATOM = '''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Example Feed</title>
+  <id>urn:uuid:60a76c80-d399-11d9-b93C-0003939e0af6</id>
+  <updated>2013-09-04T18:30:02Z</updated>
+  <entry>
+    <title>Episode One</title>
+    <id>urn:uuid:1225c695-cfb8-4ebb-aaaa-80da344efa6a</id>
+    <updated>2013-09-04T18:30:02Z</updated>
+    <published>2013-09-03T10:00:00+02:00</published>
+    <summary>The first episode.</summary>
+    <link rel="alternate" href="http://example.com/one"/>
+    <link rel="enclosure" type="audio/mpeg" length="1234"
+        href="http://example.com/one.mp3"/>
+  </entry>
+</feed>
+'''
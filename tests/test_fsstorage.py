@@ -3,15 +3,311 @@
 [Module Documentation here]
 '''
 import logging
+import os
+import stat
+
+import pytest
+
+from podfetch import fsstorage
+from podfetch.fsstorage import FileSystemStorage
+from podfetch.model import Episode
+from podfetch.model import Subscription
 
 
 LOG = logging.getLogger(__name__)
 
 
+@pytest.fixture
+def storage(tmpdir):
+    return FileSystemStorage(
+        str(tmpdir.join('config')),
+        str(tmpdir.join('index')),
+        str(tmpdir.join('content')),
+        str(tmpdir.join('cache')),
+        [],
+    )
+
+
+def test_save_index_file(storage):
+    data = [{'id': 'a', 'title': 'A'}, {'id': 'b', 'title': 'B'}]
+    storage._save_index_file('name', data)
+
+    assert storage._load_episode_index('name') == data
+    # no temp files left behind
+    assert os.listdir(storage.index_dir) == ['name.json']
+
+
+def test_save_index_file_unchanged(storage):
+    data = [{'id': 'a', 'title': 'A'}]
+    storage._save_index_file('name', data)
+    path = storage._index_path('name')
+    os.utime(path, (0, 0))
+
+    storage._save_index_file('name', data)
+    assert os.stat(path).st_mtime == 0
+
+    storage._save_index_file('name', data + [{'id': 'b'}])
+    assert os.stat(path).st_mtime != 0
+
+
+def test_save_empty_index_file(storage):
+    storage._save_index_file('name', [{'id': 'a'}])
+    storage._save_index_file('name', [])
+    assert not os.path.exists(storage._index_path('name'))
+
+
 # TODO: fixtures
 # - sub as in test_model
 
 
+def test_save_episode_journal(storage, monkeypatch):
+    sub = Subscription('name', 'http://example.com', 'content_dir')
+    storage._save_index_file('name', [{'id': 'a', 'title': 'A'}])
+
+    storage.save_episode(Episode(sub, 'b', {}, title='B'))
+    storage.save_episode(Episode(sub, 'a', {}, title='A2'))
+    assert os.path.exists(storage._journal_path('name'))
+
+    titles = [(e.id, e.title) for e in storage._load_episodes(sub)]
+    assert titles == [('a', 'A2'), ('b', 'B')]
+
+    # a large journal is merged into the index
+    monkeypatch.setattr(fsstorage, 'JOURNAL_MIN_SIZE', 0)
+    storage.save_episode(Episode(sub, 'c', {}, title='C'))
+    assert not os.path.exists(storage._journal_path('name'))
+    titles = [(e.id, e.title) for e in storage._load_episodes(sub)]
+    assert titles == [('a', 'A2'), ('b', 'B'), ('c', 'C')]
+
+
+def test_journal_incomplete_entry(storage):
+    sub = Subscription('name', 'http://example.com', 'content_dir')
+    storage.save_episode(Episode(sub, 'a', {}, title='A'))
+    with open(storage._journal_path('name'), 'ab') as f:
+        f.write(b'{"id": "b", "tit')
+
+    assert [e.id for e in storage._load_episodes(sub)] == ['a']
+
+    storage.save_episode(Episode(sub, 'c', {}, title='C'))
+    assert [e.id for e in storage._load_episodes(sub)] == ['a', 'c']
+
+
+def test_load_subscription_lazy_episodes(storage, monkeypatch):
+    sub = Subscription('name', 'http://example.com', 'content_dir')
+    storage.save_subscription(sub)
+    storage.save_episode(Episode(sub, 'a', {}, title='A'))
+
+    loaded = []
+    load_episodes = storage._load_episodes
+    def counting_load(sub):
+        loaded.append(sub.name)
+        return load_episodes(sub)
+    monkeypatch.setattr(storage, '_load_episodes', counting_load)
+
+    sub = storage.load_subscription('name')
+    assert loaded == []
+    assert sub.episode_for_id('a').title == 'A'
+    assert [e.id for e in sub.episodes] == ['a']
+    assert loaded == ['name']
+
+
+def test_cache_single_file(storage):
+    storage.cache_update('name', {'etag': 'the-etag', 'modified': 'the-date'})
+    storage.cache_put('other', 'etag', 'other-etag')
+    assert os.listdir(storage.cache_dir) == ['cache.json']
+
+    reloaded = FileSystemStorage(storage.config_dir, storage.index_dir,
+        storage.default_content_dir, storage.cache_dir, [])
+    assert reloaded.cache_get('name', 'etag') == 'the-etag'
+    assert reloaded.cache_get('name', 'modified') == 'the-date'
+    assert reloaded.cache_get('other', 'etag') == 'other-etag'
+
+    reloaded.cache_put('name', 'etag', None)
+    assert reloaded.cache_get('name', 'etag') is None
+    assert reloaded.cache_get('name', 'modified') == 'the-date'
+
+    reloaded.cache_forget('name')
+    reloaded.cache_forget('other')
+    assert os.listdir(storage.cache_dir) == []
+
+
+def test_cache_migrate_legacy_files(storage, tmpdir):
+    cache_dir = tmpdir.mkdir('cache')
+    cache_dir.join('name.etag').write('old-etag')
+    cache_dir.join('name.modified').write('old-date')
+
+    assert storage.cache_get('name', 'etag') == 'old-etag'
+    assert storage.cache_get('name', 'modified') == 'old-date'
+    assert os.listdir(storage.cache_dir) == ['cache.json']
+
+
+def test_cache_forget_legacy_files(storage, tmpdir):
+    '''Legacy files of a deleted subscription are not migrated
+    into a new subscription with the same name.'''
+    cache_dir = tmpdir.mkdir('cache')
+    cache_dir.join('name.etag').write('old-etag')
+    cache_dir.join('name.modified').write('old-date')
+
+    storage.delete_subscription('name')
+
+    assert os.listdir(storage.cache_dir) == []
+    assert storage.cache_get('name', 'etag') is None
+
+
+def test_cache_concurrent_storages(storage):
+    '''Entries written by another process are not overwritten.'''
+    other = FileSystemStorage(storage.config_dir, storage.index_dir,
+        storage.default_content_dir, storage.cache_dir, [])
+    storage.cache_put('name', 'etag', 'the-etag')
+    assert other.cache_get('name', 'etag') == 'the-etag'
+
+    storage.cache_put('first', 'etag', 'first-etag')
+    other.cache_put('second', 'etag', 'second-etag')
+
+    assert storage.cache_get('first', 'etag') == 'first-etag'
+    assert storage.cache_get('second', 'etag') == 'second-etag'
+    assert other.cache_get('first', 'etag') == 'first-etag'
+
+
+def test_cache_migrate_shared_index_dir(tmpdir):
+    '''With cache_dir == index_dir, an index is not taken for a cache.'''
+    shared = str(tmpdir.join('shared'))
+    storage = FileSystemStorage(str(tmpdir.join('config')), shared,
+        str(tmpdir.join('content')), shared, [])
+    data = [{'id': 'a', 'title': 'A'}]
+    storage._save_index_file('name', data)
+
+    assert storage.cache_get('name', 'etag') is None
+    storage.cache_put('name', 'etag', 'the-etag')
+    assert storage._load_episode_index('name') == data
+
+
+def test_save_unchanged_subscription(storage):
+    sub = Subscription('name', 'http://example.com', 'content_dir')
+    storage.save_subscription(sub)
+    path = storage._subscription_path('name')
+    os.utime(path, (0, 0))
+
+    storage.save_subscription(sub)
+    assert os.stat(path).st_mtime == 0
+
+    sub.feed_url = 'http://example.com/moved'
+    storage.save_subscription(sub)
+    assert os.stat(path).st_mtime != 0
+    assert storage.load_subscription('name').feed_url == sub.feed_url
+
+
+def test_save_subscription_like_configparser(storage):
+    sub = Subscription('name', 'http://example.com/foo%20bar', 'content_dir',
+        title='multi\nline', max_episodes=3)
+    storage.save_subscription(sub)
+
+    cfg = fsstorage._mk_config_parser()
+    cfg.read(storage._subscription_path('name'))
+    assert cfg.get('subscription', 'url') == 'http://example.com/foo%20bar'
+    assert cfg.get('subscription', 'title') == 'multi\nline'
+    assert cfg.getint('subscription', 'max_episodes') == 3
+    assert storage.load_subscription('name').title == 'multi\nline'
+
+
+def test_save_subscription_atomic(storage):
+    sub = Subscription('name', 'http://example.com', 'content_dir')
+    storage.save_subscription(sub)
+    sub.title = 'changed'
+    storage.save_subscription(sub)
+
+    path = storage._subscription_path('name')
+    assert os.listdir(os.path.dirname(path)) == ['name']
+    assert storage.load_subscription('name').title == 'changed'
+
+
+def test_write_atomic_permissions(tmpdir):
+    path = str(tmpdir.join('file'))
+    fsstorage._write_atomic(path, b'data')
+    # same as a file created with open()
+    other = str(tmpdir.join('other'))
+    with open(other, 'wb'):
+        pass
+    assert stat.S_IMODE(os.stat(path).st_mode) == \
+        stat.S_IMODE(os.stat(other).st_mode)
+
+    os.chmod(path, 0o640)
+    fsstorage._write_atomic(path, b'other data')
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+
+def test_parse_subscription_ini():
+    text = '\n'.join([
+        '# comment',
+        '[subscription]',
+        'url = http://example.com/foo%20bar?a=b',
+        'Title: the title',
+        '; another comment',
+        'enabled = no',
+        '',
+        '[other]',
+        'url = http://example.com/other',
+    ])
+    assert fsstorage._parse_subscription_ini(text) == {
+        'url': 'http://example.com/foo%20bar?a=b',
+        'title': 'the title',
+        'enabled': 'no',
+    }
+
+    # needs a real ConfigParser
+    assert fsstorage._parse_subscription_ini(
+        '[subscription]\ntitle = multi\n  line\n') is None
+    assert fsstorage._parse_subscription_ini(
+        '[subscription]\nurl = a\nurl = b\n') is None
+
+
+def test_load_subscription_multiline_value(storage, tmpdir):
+    tmpdir.mkdir('config').join('name').write('\n'.join([
+        '[subscription]',
+        'url = http://example.com',
+        'title = multi',
+        '  line',
+        'max_episodes = 3',
+        'enabled = off',
+    ]))
+    sub = storage.load_subscription('name')
+    assert sub.feed_url == 'http://example.com'
+    assert sub.title == 'multi\nline'
+    assert sub.max_episodes == 3
+    assert not sub.enabled
+
+
+def test_load_subscription_reparses_modified_file(storage, tmpdir):
+    config = tmpdir.mkdir('config').join('name')
+    config.write('[subscription]\nurl=http://example.com/a\n')
+    os.utime(str(config), (1000, 1000))
+    assert storage.load_subscription('name').feed_url == 'http://example.com/a'
+    assert storage.load_subscription('name').feed_url == 'http://example.com/a'
+
+    config.write('[subscription]\nurl=http://example.com/b\n')
+    os.utime(str(config), (2000, 2000))
+    assert storage.load_subscription('name').feed_url == 'http://example.com/b'
+
+    # same mtime, different size
+    config.write('[subscription]\nurl=http://example.com/long\n')
+    os.utime(str(config), (2000, 2000))
+    assert storage.load_subscription('name').feed_url == (
+        'http://example.com/long')
+
+
+def test_iter_subscriptions(storage, tmpdir):
+    config_dir = tmpdir.mkdir('config')
+    config_dir.join('one').write('[subscription]\nurl=http://example.com/1\n')
+    config_dir.join('two').write('[subscription]\nurl=http://example.com/2\n')
+    config_dir.mkdir('subdir')
+
+    names = sorted(s.name for s in storage.iter_subscriptions())
+    assert names == ['one', 'two']
+
+
+def test_iter_subscriptions_no_config_dir(storage):
+    assert list(storage.iter_subscriptions()) == []
+
+
 def DISABLED_test_save(tmpdir, sub):
     sub.max_episodes = 123
     sub.filename_template = 'template'
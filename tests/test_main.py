@@ -12,6 +12,7 @@ try:
 except ImportError:
     import ConfigParser as configparser  # python 2
 import argparse
+import os
 
 import pytest
 import mock
@@ -159,8 +160,28 @@ def test_remove_content(monkeypatch, mock_app):
 # ls -------------------------------------------------------------------------
 
 
-def test_ls():
-    pass
+def test_ls(monkeypatch, mock_app, capsys):
+    with_mock_app(monkeypatch, mock_app)
+    sub = mock.Mock(title='the-podcast')
+    episodes = [
+        mock.Mock(subscription=sub, title='second',
+            pubdate=(2001, 2, 4, 0, 0, 0, 0), files=[]),
+        mock.Mock(subscription=sub, title='first',
+            pubdate=(2001, 2, 3, 0, 0, 0, 0), files=[]),
+    ]
+    mock_app.list_episodes = mock.MagicMock(return_value=episodes)
+
+    main.main(argv=['ls'])
+
+    out = capsys.readouterr().out
+    assert out == '\n'.join([
+        'Podfetch Episodes',
+        '-----------------',
+        '2001-02-04:',
+        ' - [the-podcast] second',
+        '2001-02-03:',
+        ' - [the-podcast] first',
+    ]) + '\n'
 
 
 # purge ----------------------------------------------------------------------
@@ -173,7 +194,80 @@ def test_purge():
 # config ---------------------------------------------------------------------
 
 
-# TODO write tests
+def test_unique_config_paths(tmpdir):
+    cfg = tmpdir.join('podfetch.conf')
+    cfg.write('[podfetch]\n')
+    link = tmpdir.join('link.conf')
+    link.mksymlinkto(cfg)
+    missing = tmpdir.join('missing.conf')
+
+    paths = [str(cfg), str(link), str(missing), str(cfg)]
+    assert main._unique_paths(paths) == [os.path.realpath(str(cfg))]
+
+
+# logging ---------------------------------------------------------------------
+
+
+def test_configure_logging_twice():
+    '''Repeated calls replace the handlers from the previous call.'''
+    import logging
+    rootlog = logging.getLogger()
+    options = argparse.Namespace(quiet=False, verbose=False, logfile=None)
+    host_handlers = rootlog.handlers[:]
+    rootlog.handlers = []
+    try:
+        main.configure_logging(options)
+        count = len(rootlog.handlers)
+        assert count == 1
+        main.configure_logging(options)
+        assert len(rootlog.handlers) == count
+
+        # options from a later call are applied
+        options.verbose = True
+        main.configure_logging(options)
+        assert rootlog.handlers[0].level == logging.DEBUG
+
+        options.quiet = True
+        main.configure_logging(options)
+        assert len(rootlog.handlers) == count - 1
+    finally:
+        main.configure_logging(argparse.Namespace(quiet=True, logfile=None))
+        rootlog.handlers = host_handlers
+
+
+def test_configure_logging_keeps_host_handlers():
+    '''Handlers installed by someone else are left alone.'''
+    import logging
+    rootlog = logging.getLogger()
+    options = argparse.Namespace(quiet=False, verbose=False, logfile=None)
+    host_handler = logging.NullHandler()
+    host_handlers = rootlog.handlers[:]
+    rootlog.handlers = [host_handler]
+    try:
+        main.configure_logging(options)
+        assert rootlog.handlers == [host_handler]
+
+        main.configure_logging(options, force=True)
+        assert len(rootlog.handlers) == 2
+        assert host_handler in rootlog.handlers
+    finally:
+        main.configure_logging(argparse.Namespace(quiet=True, logfile=None),
+                               force=True)
+        rootlog.handlers = host_handlers
+
+
+# parser ----------------------------------------------------------------------
+
+
+def test_parser_is_reused(monkeypatch, mock_app):
+    with_mock_app(monkeypatch, mock_app)
+    main.main(argv=['update'])
+    parser = main._PARSER
+    assert parser is not None
+
+    main.main(argv=['update', '--force'])
+    assert main._PARSER is parser
+    assert mock_app.update.call_count == 2
 
 
 # helpers ---------------------------------------------------------------------
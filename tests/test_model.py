@@ -7,8 +7,11 @@ test_model
 
 Tests for `model` module.
 '''
+import errno
+import io
 import os
 import stat
+import time
 from datetime import datetime
 from datetime import timedelta
 
@@ -21,6 +24,7 @@ from podfetch.model import Subscription
 from podfetch.model import Episode
 from podfetch.model import unique_filename
 from podfetch.exceptions import NoSubscriptionError
+from podfetch.exceptions import NoEpisodeError
 from podfetch.exceptions import FeedNotFoundError
 
 from tests import common
@@ -112,9 +116,10 @@ def with_dummy_feed(monkeypatch, status=200, href=None,
 
 def with_mock_download(monkeypatch):
 
-    def create_file(url, dst):
+    def create_file(url, dst, etag=None, modified=None):
         with open(dst, 'w') as f:
             f.write('something')
+        return {'etag': None, 'modified': None}
 
     mock_download = mock.MagicMock(side_effect=create_file)
     monkeypatch.setattr(model, 'download', mock_download)
@@ -172,6 +177,24 @@ class DummyEnclosure(_Dummy):
 # Subscription Tests ----------------------------------------------------------
 
 
+def test_subscription_slots(sub):
+    '''Subscriptions do not carry an instance ``__dict__``.'''
+    assert not hasattr(sub, '__dict__')
+    with pytest.raises(AttributeError):
+        sub.bogus = 'value'
+
+
+def test_episode_for_id(sub):
+    sub.episodes = [Episode(sub, 'id.{}'.format(i), SUPPORTED_CONTENT)
+                    for i in range(3)]
+    assert sub.episode_for_id('id.1') is sub.episodes[1]
+    with pytest.raises(NoEpisodeError):
+        sub.episode_for_id('bogus')
+
+    sub._add_episode(Episode(sub, 'new-id', SUPPORTED_CONTENT))
+    assert sub.episode_for_id('new-id') is sub.episodes[-1]
+
+
 def test_apply_updates_max_episodes(storage, sub, monkeypatch):
     '''in apply updates, max entries to be processed
     is max_episodes for this subscription.
@@ -180,9 +203,37 @@ def test_apply_updates_max_episodes(storage, sub, monkeypatch):
     with_mock_download(monkeypatch)
 
     sub.max_episodes = 1
-    sub._process_feed_entry = mock.MagicMock()
     sub.update(storage)
-    assert sub._process_feed_entry.call_count == 1
+    assert model.download.call_count == 1
+    # the newest entry is selected
+    assert sub.episodes[0].pubdate[:3] == (2013, 9, 3)
+
+
+def test_apply_updates_max_episodes_no_date(storage, sub, monkeypatch):
+    '''An entry without a date counts as published now,
+    for selecting entries as for the episode's pubdate.'''
+    with_dummy_feed(monkeypatch, feed_data=common.FEED_DATA.replace(
+        '<pubDate>Mon, 19 Aug 2013 00:00:00 +0200</pubDate>', ''))
+    with_mock_download(monkeypatch)
+
+    sub.max_episodes = 1
+    sub.update(storage)
+    assert [e.id for e in sub.episodes] == [
+        '/1live_planb_reportage_made_by_wdr_20130819.mp3']
+
+
+def test_apply_updates_max_episodes_no_attachment(storage, sub, monkeypatch):
+    '''Entries without a supported enclosure do not count
+    towards max_episodes.'''
+    with_dummy_feed(monkeypatch, feed_data=common.FEED_DATA.replace(
+        'type="audio/mpeg"', 'type="text/html"', 1))
+    with_mock_download(monkeypatch)
+
+    sub.max_episodes = 1
+    sub.update(storage)
+    assert model.download.call_count == 1
+    assert [e.id for e in sub.episodes] == [
+        '/1live_planb_reportage_made_by_wdr_20130819.mp3']
 
 
 def test_apply_updates_error_handling(storage, sub, monkeypatch):
@@ -205,7 +256,7 @@ def test_update_feed_unchanged(storage, sub, monkeypatch):
 
     storage.cache_put(sub.name, 'etag', 'etag-value')
     storage.cache_put(sub.name, 'modified', 'modified-value')
-    sub._update_entries = mock.MagicMock()
+    monkeypatch.setattr(Subscription, '_update_entries', mock.MagicMock())
 
     sub.update(storage)
 
@@ -237,7 +288,7 @@ def test_update_store_feed_headers(storage, sub, monkeypatch):
 
     storage.cache_put(sub.name, 'etag', 'initial-etag')
     storage.cache_put(sub.name, 'modified', 'intial-modified')
-    sub._update_entries = mock.MagicMock()
+    monkeypatch.setattr(Subscription, '_update_entries', mock.MagicMock())
 
     sub.update(storage)
 
@@ -255,7 +306,8 @@ def test_failed_update_no_store_feed_headers(storage, sub, monkeypatch):
     with_mock_download(monkeypatch)
     storage.cache_put(sub.name, 'etag', 'initial-etag')
     storage.cache_put(sub.name, 'modified', 'initial-modified')
-    sub._update_entries = mock.MagicMock(side_effect=ValueError)
+    monkeypatch.setattr(Subscription, '_update_entries',
+        mock.MagicMock(side_effect=ValueError))
 
     with pytest.raises(ValueError):
         sub.update(storage)
@@ -269,7 +321,7 @@ def test_update_feed_moved_permanently(storage, sub, monkeypatch):
     with_dummy_feed(monkeypatch, status=301, href=new_url)
     with_mock_download(monkeypatch)
 
-    sub._update_entries = mock.MagicMock()
+    monkeypatch.setattr(Subscription, '_update_entries', mock.MagicMock())
 
     sub.update(storage)
 
@@ -295,26 +347,278 @@ def test_update_error_fetching_feed(storage, sub, monkeypatch):
     assert modified == 'initial-modified'
 
 
-def DISABLED_test_downloaded_file_perms():
-    '''Assert that a downloaded file has the correct permissions.'''
-    #TODO: mock requests.get(url, stream=True) ?
+def test_parallel_downloads_unique_filenames(storage, sub, monkeypatch):
+    '''Episodes downloaded in parallel must not share a local file.'''
+    with_dummy_feed(monkeypatch)
+    with_mock_download(monkeypatch)
+    sub.filename_template = 'constant'
+
+    sub.update(storage)
+
+    local_files = [e.files[0][2] for e in sub.episodes]
+    assert len(local_files) == 2
+    assert len(set(local_files)) == 2
+    assert all(os.path.isfile(f) for f in local_files)
+
+
+def with_mock_session(monkeypatch, chunks=(b'some', b'data'), status=200,
+    headers=None, body=b'', history=None):
+    response = mock.MagicMock()
+    response.status_code = status
+    response.headers = headers or {}
+    response.raw = io.BytesIO(body)
+    response.content = body
+    response.url = 'http://example.com/final'
+    response.history = history or []
+    response.iter_content = mock.MagicMock(side_effect=lambda *a: iter(chunks))
+    mock_get = mock.MagicMock(return_value=response)
+    monkeypatch.setattr(model._SESSION, 'get', mock_get)
+    return mock_get
+
+
+def test_fetch_feed(monkeypatch):
+    mock_get = with_mock_session(monkeypatch,
+        body=common.FEED_DATA.encode('utf-8'),
+        headers={'ETag': 'the-etag', 'Last-Modified': 'the-modified'})
+
+    feed = model._fetch_feed('http://example.com', etag='old-etag')
+
+    assert mock_get.call_args[1]['headers'] == {'If-None-Match': 'old-etag'}
+    assert feed.status == 200
+    assert feed.href == 'http://example.com/final'
+    assert feed.get('etag') == 'the-etag'
+    assert feed.get('modified') == 'the-modified'
+    assert len(feed.entries) == 2
+
+
+def test_fetch_feed_not_modified(monkeypatch):
+    with_mock_session(monkeypatch, status=304)
+    feed = model._fetch_feed('http://example.com', etag='old-etag')
+    assert feed.status == 304
+    assert feed.entries == []
+
+
+def test_fetch_feed_moved_permanently(monkeypatch):
+    with_mock_session(monkeypatch, body=common.FEED_DATA.encode('utf-8'),
+        history=[mock.Mock(status_code=301)])
+    feed = model._fetch_feed('http://example.com')
+    assert feed.status == 301
+    assert feed.href == 'http://example.com/final'
+
+
+def test_fetch_feed_not_found(monkeypatch):
+    with_mock_session(monkeypatch, status=404)
+    with pytest.raises(FeedNotFoundError):
+        model._fetch_feed('http://example.com')
+
+
+@pytest.mark.parametrize('feed_data', [
+    common.FEED_DATA, common.FEED_NO_IDS, common.FEED_ATOM])
+def test_parse_feed_like_feedparser(feed_data):
+    '''Entries from the atoma parser match those from feedparser.'''
+    pytest.importorskip('atoma')
+    data = feed_data.encode('utf-8')
+    expected = feedparser.parse(data).entries
+    entries = model._parse_feed(data, {}).entries
+
+    assert len(entries) == len(expected)
+    for entry, other in zip(entries, expected):
+        assert model.id_for_entry(entry) == model.id_for_entry(other)
+        assert entry.published_parsed == other.published_parsed
+        assert [(e.href, e.type) for e in entry.enclosures] == [
+            (e.href, e.type) for e in other.enclosures]
+
+
+@pytest.mark.parametrize('feed_data', [
+    common.FEED_DATA,
+    common.FEED_NO_IDS,
+    # ISO 8601 dates beside RFC 822
+    common.FEED_DATA.replace(
+        'Wed, 04 Sep 2013 00:00:00 +0200', '2013-09-03T12:00:05Z').replace(
+        'Mon, 19 Aug 2013 00:00:00 +0200', '2013-09-03'),
+])
+def test_stream_parse_like_feedparser(feed_data):
+    '''Entries from the streaming parser match those from feedparser.'''
+    pytest.importorskip('lxml')
+    data = feed_data.encode('utf-8')
+    expected = feedparser.parse(data).entries
+    entries = model._stream_parse(io.BytesIO(data)).entries
+
+    assert len(entries) == len(expected)
+    for entry, other in zip(entries, expected):
+        assert model.id_for_entry(entry) == model.id_for_entry(other)
+        assert entry.published_parsed is not None
+        assert entry.published_parsed == other.published_parsed
+        assert [(e.href, e.type) for e in entry.enclosures] == [
+            (e.href, e.type) for e in other.enclosures]
+
+
+def test_stream_parse_same_ids():
+    '''Episodes without a guid get the same id,
+    no matter if the feed is stream-parsed or not.'''
+    pytest.importorskip('lxml')
+    data = common.FEED_NO_IDS.replace(
+        '<title>Geiseldrama in Kenia</title>',
+        '<title>\n        Geiseldrama in Kenia\n      </title>').encode('utf-8')
+    expected = model._parse_feed(data, {}).entries
+    entries = model._stream_parse(io.BytesIO(data)).entries
+
+    assert [model.id_for_entry(e) for e in entries] == [
+        model.id_for_entry(e) for e in expected]
+
+
+def test_stream_parse_bad_date():
+    '''A pubDate that is not a date is ignored.'''
+    pytest.importorskip('lxml')
+    data = common.FEED_DATA.replace(
+        'Wed, 04 Sep 2013 00:00:00 +0200', 'not a date').encode('utf-8')
+    entries = model._stream_parse(io.BytesIO(data)).entries
+
+    assert entries[0].published_parsed is None
+
+
+@pytest.mark.parametrize('feed_data', [common.FEED_ATOM, 'not <xml'])
+def test_stream_parse_not_rss(feed_data):
+    pytest.importorskip('lxml')
+    assert model._stream_parse(io.BytesIO(feed_data.encode('utf-8'))) is None
+
+
+def test_fetch_large_feed(monkeypatch):
+    '''Large feeds are spooled and parsed item by item.'''
+    pytest.importorskip('lxml')
+    data = common.FEED_DATA.encode('utf-8')
+    with_mock_session(monkeypatch, chunks=(data[:100], data[100:]),
+        headers={'Content-Length': str(model.STREAM_PARSE_SIZE + 1)})
+
+    feed = model._fetch_feed('http://example.com')
+
+    assert feed.status == 200
+    assert len(feed.entries) == 2
+
+
+def test_download(monkeypatch, tmpdir):
+    '''Download to a local file with the correct permissions.'''
+    mock_get = with_mock_session(monkeypatch)
 
     dst = str(tmpdir.join('dst'))
     model.download('some-url', dst)
-    mode = os.stat(dst).st_mode
+
+    assert mock_get.call_args[0][0] == 'some-url'
+    with open(dst, 'rb') as f:
+        assert f.read() == b'somedata'
+
+    # no temporary files are left behind
+    assert os.listdir(str(tmpdir)) == ['dst']
 
     # minimum permissions we want: -rw-r--r--
+    mode = os.stat(dst).st_mode
     assert mode & stat.S_IRUSR  # owner read
     assert mode & stat.S_IWUSR  # owner write
     assert mode & stat.S_IRGRP  # group read
     assert mode & stat.S_IROTH  # other read
 
 
+def test_download_not_modified(monkeypatch, tmpdir):
+    '''Send conditional headers and keep the local file on HTTP 304.'''
+    mock_get = with_mock_session(monkeypatch, status=304)
+    dst = tmpdir.join('dst')
+    dst.write('existing')
+
+    rv = model.download('some-url', str(dst), etag='the-etag',
+                        modified='the-modified')
+
+    assert rv is None
+    assert dst.read() == 'existing'
+    headers = mock_get.call_args[1]['headers']
+    assert headers['If-None-Match'] == 'the-etag'
+    assert headers['If-Modified-Since'] == 'the-modified'
+
+
+def test_episode_remembers_http_cache(monkeypatch, sub):
+    '''ETag and Last-Modified of a download are stored on the Episode
+    and sent with a forced download.'''
+    mock_get = with_mock_session(monkeypatch,
+        headers={'ETag': 'the-etag', 'Last-Modified': 'the-modified'})
+    url = 'http://example.com/1'
+    episode = Episode(sub, 'id', SUPPORTED_CONTENT,
+        files=[(url, 'audio/mpeg', None)])
+
+    episode.download()
+    assert episode.http_cache[url]['etag'] == 'the-etag'
+    assert episode.http_cache[url]['modified'] == 'the-modified'
+    assert not mock_get.call_args[1]['headers']
+
+    restored = Episode.from_dict(sub, SUPPORTED_CONTENT, episode.as_dict())
+    with_mock_session(monkeypatch, status=304)
+    restored.download(force=True)
+    headers = model._SESSION.get.call_args[1]['headers']
+    assert headers['If-None-Match'] == 'the-etag'
+    assert restored.files == episode.files
+
+
+def test_download_skips_unsupported_files(monkeypatch, sub):
+    '''The local file is stored with the right entry
+    when unsupported files come first.'''
+    with_mock_download(monkeypatch)
+    episode = Episode(sub, 'id', SUPPORTED_CONTENT, files=[
+        ('http://example.com/page', 'text/html', None),
+        ('http://example.com/audio', 'audio/mpeg', None),
+    ])
+
+    assert episode.download()
+    assert episode.files[0][2] is None
+    assert os.path.isfile(episode.files[1][2])
+
+    # already downloaded
+    assert not episode.download()
+    assert model.download.call_count == 1
+
+
+def test_directory_listing(tmpdir):
+    tmpdir.join('a.mp3').write('data')
+    existing = model.DirectoryListing()
+
+    assert str(tmpdir.join('a.mp3')) in existing
+    assert str(tmpdir.join('b.mp3')) not in existing
+    assert str(tmpdir.join('missing', 'a.mp3')) not in existing
+    assert None not in existing
+
+
+def test_download_with_listing(monkeypatch, sub, tmpdir):
+    '''Files in the listing are not downloaded again.'''
+    with_mock_download(monkeypatch)
+    local = tmpdir.join('a.mp3')
+    local.write('data')
+    episode = Episode(sub, 'id', SUPPORTED_CONTENT, files=[
+        ('http://example.com/a', 'audio/mpeg', str(local)),
+        ('http://example.com/b', 'audio/mpeg', str(tmpdir.join('b.mp3'))),
+    ])
+
+    assert episode.download(existing=model.DirectoryListing())
+    assert model.download.call_count == 1
+    assert model.download.call_args[0][0] == 'http://example.com/b'
+
+
+def test_delete_local_files(monkeypatch, sub):
+    with_mock_session(monkeypatch, headers={'ETag': 'the-etag'})
+    url = 'http://example.com/1'
+    episode = Episode(sub, 'id', SUPPORTED_CONTENT,
+        files=[(url, 'audio/mpeg', None)])
+    episode.download()
+    local_file = episode.files[0][2]
+    assert os.path.isfile(local_file)
+
+    episode.delete_local_files()
+    assert not os.path.exists(local_file)
+    assert episode.files == []
+    assert episode.http_cache == {}
+
+
 def test_download_error(storage, sub, monkeypatch):
     '''if download failed, episode should be present but w/o local file'''
     with_dummy_feed(monkeypatch)
 
-    def failing_download(url, dst):
+    def failing_download(url, dst, etag=None, modified=None):
         raise ValueError
 
     # precondition
@@ -410,6 +714,18 @@ def test_purge_keepall(storage, sub, monkeypatch):
     assert len(os.listdir(sub.content_dir)) == 2
 
 
+def test_remove_empty_directories(sub):
+    os.makedirs(os.path.join(sub.content_dir, 'a', 'b', 'c'))
+    os.makedirs(os.path.join(sub.content_dir, 'keep', 'empty'))
+    with open(os.path.join(sub.content_dir, 'keep', 'file'), 'w') as f:
+        f.write('content')
+
+    sub._remove_empty_directories()
+
+    assert os.listdir(sub.content_dir) == ['keep']
+    assert os.listdir(os.path.join(sub.content_dir, 'keep')) == ['file']
+
+
 # Tests Episode ---------------------------------------------------------------
 
 
@@ -441,6 +757,18 @@ def test_episode_download(monkeypatch, tmpdir, sub):
     assert old_len == len(episode.files)
 
 
+def test_episode_download_mixed_case_type(monkeypatch, sub):
+    '''Index entries may have content types in their original case.'''
+    mock_download = with_mock_download(monkeypatch)
+    files = [('http://example.com/1', 'Audio/MPEG', None)]
+    episode = Episode(sub, 'id', SUPPORTED_CONTENT, files=files)
+
+    assert episode.has_attachments
+    episode.download()
+    assert mock_download.call_count == 1
+    assert episode.files[0][2].endswith('.mp3')
+
+
 def test_episode_force_download(monkeypatch, tmpdir, sub):
     mock_download = with_mock_download(monkeypatch)
 
@@ -501,6 +829,7 @@ def test_generate_filename_episode(sub):
     # ext in template
     sub.filename_template = 'something.{ext}'
     assert gen(1).endswith('01.mp3')
+    assert gen(None) == 'something.mp3'
 
     # timestamp
     sub.filename_template = '{year}-{month}-{day}T{hour}-{minute}-{second}'
@@ -529,6 +858,24 @@ def test_generate_filename_pathsep(sub):
     assert generated == '2001/02/the_title.mp3'
 
 
+def test_filename_template_values_reused(sub):
+    '''Template values are shared between the files of one episode,
+    except those that depend on the content type.'''
+    sub.filename_template = '{title}-{kind}'
+    episode = Episode(sub, 'the-id', SUPPORTED_CONTENT, title='the title')
+    template_values = {}
+
+    first = episode._generate_filename('audio/mpeg', 0,
+        template_values=template_values)
+    episode.title = 'changed'
+    second = episode._generate_filename('video/mpeg', 1,
+        template_values=template_values)
+
+    assert first == 'the_title-audio.mp3'
+    assert second == 'the_title-video-01.mp4'
+    assert template_values == {'title': 'the_title'}
+
+
 def test_filename_template_from_app_config(sub):
     '''If no template is set for the subscription,
     use template from app-config'''
@@ -660,6 +1007,23 @@ def test_safe_filename():
         assert model.safe_filename(unsafe) == expected
 
 
+def test_template_fields():
+    assert model._template_fields('{pub_date}_{id}') == {'pub_date', 'id'}
+    assert model._template_fields('{title:.10}-{a.b}{c[0]}') == {
+        'title', 'a', 'c'}
+    assert model._template_fields('plain') == set()
+
+
+def test_id_for_entry():
+    assert model.id_for_entry({'id': 'the-id'}) == 'the-id'
+
+    entry = feedparser.FeedParserDict(
+        published_parsed=time.struct_time((2013, 9, 3, 12, 0, 5, 1, 246, 0)),
+        title='the title',
+    )
+    assert model.id_for_entry(entry) == '201393120512460.the title'
+
+
 def test_pretty_filename():
     cases = [
         ('', ''),
@@ -669,6 +1033,8 @@ def test_pretty_filename():
         ('abcäöüßabc', 'abcaeoeuessabc'),
         ('multi _ separator', 'multi_separator'),
         ('a---b', 'a-b'),
+        ('a...b__c', 'a.b_c'),
+        ('a-_.b', 'a-_.b'),
         ('abcÄÜÖabc', 'abcAeUeOeabc'),
         ('what?', 'what'),
         ('***', ''),
@@ -679,11 +1045,25 @@ def test_pretty_filename():
         # non-ascii characters are deleted
         ('A³', 'A'),
         ('a€c', 'ac'),
+        # other whitespace is deleted
+        ('tab\there', 'tabhere'),
     ]
     for unpretty, expected in cases:
         assert model.pretty(unpretty) == expected
 
 
+def test_from_entry_content_type_case(sub):
+    entry = feedparser.FeedParserDict(
+        id='the-id', title='title', description='description',
+        published_parsed=time.struct_time((2013, 9, 3, 12, 0, 5, 1, 246, 0)),
+        links=[feedparser.FeedParserDict(
+            rel='enclosure', href='http://example.com/a', type='Audio/MPEG')],
+    )
+    episode = Episode.from_entry(sub, SUPPORTED_CONTENT, entry)
+    assert episode.files == [('http://example.com/a', 'audio/mpeg', None)]
+    assert episode.has_attachments
+
+
 def test_file_extension_for_mime(sub):
     episode = Episode(sub, 'id', SUPPORTED_CONTENT)
     supported_cases = [
@@ -727,6 +1107,74 @@ def test_unique_filename(tmpdir):
     assert unique1.endswith('.ext')
 
 
+def test_unique_filename_link(tmpdir):
+    filename = str(tmpdir.join('file.ext'))
+    src = tmpdir.join('.src.part')
+    src.write('content')
+
+    linked0 = unique_filename(filename, src=str(src))
+    linked1 = unique_filename(filename, src=str(src))
+    assert linked0 == filename
+    assert linked1 != linked0
+    assert linked1.endswith('.ext')
+    assert tmpdir.join('file.ext').read() == 'content'
+    assert open(linked1).read() == 'content'
+
+
+def test_unique_filename_no_hardlinks(tmpdir, monkeypatch):
+    '''Without hardlinks, the name is reserved before the file is moved.'''
+    def no_link(src, dst):
+        raise OSError(errno.EPERM, 'Operation not permitted')
+
+    monkeypatch.setattr(os, 'link', no_link)
+    filename = str(tmpdir.join('file.ext'))
+    src = tmpdir.join('.src.part')
+
+    src.write('first')
+    moved0 = unique_filename(filename, src=str(src))
+    src.write('second')
+    moved1 = unique_filename(filename, src=str(src))
+    assert moved0 == filename
+    assert moved1 != moved0
+    assert open(moved0).read() == 'first'
+    assert open(moved1).read() == 'second'
+
+
+def test_unique_filename_link_error(tmpdir, monkeypatch):
+    '''Other errors from os.link() are raised.'''
+    def no_access(src, dst):
+        raise OSError(errno.EACCES, 'Permission denied')
+
+    monkeypatch.setattr(os, 'link', no_access)
+    src = tmpdir.join('.src.part')
+    src.write('content')
+    with pytest.raises(PermissionError):
+        unique_filename(str(tmpdir.join('file.ext')), src=str(src))
+    assert os.listdir(str(tmpdir)) == ['.src.part']
+
+
+def test_episode_download_no_placeholder(monkeypatch, sub, tmpdir):
+    '''The final filename is only taken once the download is complete.'''
+    content_dir = tmpdir.mkdir('episodes')
+    sub.content_dir = str(content_dir)
+    files = [('http://example.com/1', 'audio/mpeg', None)]
+
+    def failing_download(url, dst, etag=None, modified=None):
+        assert os.listdir(str(content_dir)) == [os.path.basename(dst)]
+        raise ValueError
+
+    monkeypatch.setattr(model, 'download', failing_download)
+    episode = Episode(sub, 'id', SUPPORTED_CONTENT, files=files)
+    with pytest.raises(ValueError):
+        episode.download()
+    assert os.listdir(str(content_dir)) == []
+
+    with_mock_download(monkeypatch)
+    episode.download()
+    local_file = episode.files[0][2]
+    assert os.listdir(str(content_dir)) == [os.path.basename(local_file)]
+
+
 def test_feeditem_no_ids(storage, sub, monkeypatch):
     '''Handling a RSS-feed where the //item/guid is missing.
     Nornally, entry.id is used to generate the filename and
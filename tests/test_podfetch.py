@@ -10,7 +10,10 @@ Tests for `podfetch` module.
 import pytest
 import os
 
+import feedparser
+
 from podfetch import application
+from podfetch import model
 from podfetch.predicate import WildcardFilter
 from podfetch.exceptions import NoSubscriptionError
 from podfetch.model import Episode, require_directory
@@ -162,6 +165,50 @@ def test_name_from_url():
         assert application.name_from_url(url) == expected
 
 
+def test_update_keeps_moved_url_on_error(app, monkeypatch):
+    '''A new feed URL from HTTP 301 is saved,
+    even if processing the feed entries fails.'''
+    new_url = 'http://example.com/moved'
+    app.add_subscription('http://example.com/feed', 'the-name')
+
+    def fetch_feed(url, etag=None, modified=None):
+        return feedparser.FeedParserDict(
+            entries=[], status=301, href=new_url)
+
+    def fail(*args, **kwargs):
+        raise ValueError('entries failed')
+
+    monkeypatch.setattr(model, '_fetch_feed', fetch_feed)
+    monkeypatch.setattr(model.Subscription, '_update_entries', fail)
+
+    app.update()
+
+    assert app.subscription_for_name('the-name').feed_url == new_url
+
+
+@pytest.mark.parametrize('update_threads', [1, 4])
+def test_update_broken_index(app, monkeypatch, update_threads):
+    '''A broken index only affects its own subscription.'''
+    app.update_threads = update_threads
+    app.add_subscription('http://example.com/broken', 'broken')
+    app.add_subscription('http://example.com/good', 'good')
+    with open(os.path.join(app.index_dir, 'broken.json'), 'w') as f:
+        f.write('not json')
+
+    fetched = []
+
+    def fetch_feed(url, etag=None, modified=None):
+        fetched.append(url)
+        return feedparser.FeedParserDict(entries=[], status=200, href=url)
+
+    monkeypatch.setattr(model, '_fetch_feed', fetch_feed)
+
+    app.update()
+
+    assert fetched == ['http://example.com/good']
+    assert app.list_episodes() == []
+
+
 def _create_subscription(app, name,
     url=None, max_episodes=-1, create_episodes=0):
     _write_subscription_config(
@@ -179,6 +226,14 @@ def _create_subscription(app, name,
             f.write('some content')
 
 
+def test_download_threads(app):
+    app.download_threads = 2
+    app.add_subscription('some-url', 'name')
+
+    assert app.subscription_for_name('name').download_threads == 2
+    assert [s.download_threads for s in app.iter_subscriptions()] == [2]
+
+
 def test_edit_simple(app):
     '''Assert that editing of simple subscription properties works.'''
     name = 'the-name'